@@ -0,0 +1,424 @@
+#
+# deterministic end-to-end benchmark for LovecraftRL
+#
+# seeds the game's random number generator, starts a new game and plays a
+# scripted sequence of key presses through handle_keys() and the play_game()
+# turn logic, on the headless backend. the time spent in each phase of the
+# game (generation, FOV, AI, render and save) is reported as JSON, so runs
+# can be compared to catch performance regressions. autosave is the part of a
+# save that blocks the game (taking the snapshot), save the time spent waiting
+# for the background writes to finish.
+#
+# --startup N also times how long the game takes to start (importing it and
+# its libtcod backend, and setting up the screen, i.e. everything up to
+# main_menu) in N fresh interpreters, on the backend given by --backend.
+#
+# --saves times saving and loading instead, for dungeons of different depths
+# (see save_scaling), and reports the bytes on disk and the peak memory use
+# for each depth.
+#
+# usage:
+#   python benchmark.py [--turns N] [--seed S] [--output FILE]
+#                       [--baseline FILE] [--tolerance T]
+#                       [--startup N] [--backend libtcod|headless]
+#   python benchmark.py --saves [--depths 1,5,10] [--turns-per-floor N]
+#                       [--seed S] [--output FILE]
+#                       [--baseline FILE] [--tolerance T]
+#
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# the benchmark feeds its input straight into the headless backend, so it has
+#   to be selected before the game is imported
+BACKEND = os.environ.get('LOVECRAFTRL_BACKEND', 'libtcod')
+os.environ['LOVECRAFTRL_BACKEND'] = 'headless'
+
+import libtcodheadless as libtcod
+import lovecraftrl as game
+
+# keys the script picks from, weighted by how often they appear: mostly
+#   moves, with some waiting and picking up
+SCRIPT_KEYS = 'hjklyubn' * 4 + '..,'
+
+# game functions timed for each phase. time spent in a phase that is called
+#   from inside another one (e.g. compute_fov from render_all) only counts
+#   towards the inner phase
+PHASES = [('generation', 'make_map'),
+          ('generation', 'initialize_floor'),
+          ('fov', 'compute_fov'),
+          ('ai', 'take_monster_turns'),
+          ('render', 'render_all'),
+          ('save', 'save_game'),
+          ('autosave', 'autosave')]
+
+# dungeon depths (numbers of floors) timed by --saves
+SAVE_DEPTHS = [1, 2, 5, 10, 20, 50]
+
+# run in a fresh interpreter to time the game's startup. prints the seconds
+#   from before the import to just before main_menu would be called
+STARTUP_SCRIPT = """
+import time
+started = time.time()
+import lovecraftrl
+lovecraftrl.initialize_screen()
+print(time.time() - started)
+"""
+
+
+
+class PhaseTimer:
+    # accumulates time and call counts per phase, excluding nested phases
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.stack = []
+
+    def wrap(self, phase, function):
+        def timed(*args, **kwargs):
+            self.start(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stop()
+        return timed
+
+    def start(self, phase):
+        now = time.time()
+        if self.stack:
+            # pause the enclosing phase
+            (outer, started) = self.stack[-1]
+            self.add(outer, now - started)
+        self.stack.append((phase, now))
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def stop(self):
+        now = time.time()
+        (phase, started) = self.stack.pop()
+        self.add(phase, now - started)
+        if self.stack:
+            # resume the enclosing phase
+            (outer, started) = self.stack[-1]
+            self.stack[-1] = (outer, now)
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def report(self):
+        phases = {}
+        for phase in sorted(self.calls):
+            seconds = self.seconds.get(phase, 0.0)
+            phases[phase] = {'seconds': seconds,
+                             'calls': self.calls[phase],
+                             'ms_per_call': 1000.0 * seconds /
+                                            self.calls[phase]}
+        return phases
+
+
+
+def script(turns, seed, descend_every):
+    # the key presses to play, one per turn. '/' takes the stairs down
+    r = random.Random(seed)
+    keys = []
+    for turn in range(1, turns + 1):
+        if descend_every and turn % descend_every == 0:
+            keys.append('/')
+        else:
+            keys.append(r.choice(SCRIPT_KEYS))
+    return keys
+
+
+
+def run(turns = 1000, seed = 1, descend_every = 200, save_every = 100):
+    timer = PhaseTimer()
+    originals = {}
+    for (phase, name) in PHASES:
+        originals[name] = getattr(game, name)
+        setattr(game, name, timer.wrap(phase, originals[name]))
+
+    # keep the save file (and anything else the game writes) out of the way
+    workdir = tempfile.mkdtemp(prefix = 'lovecraftrl-benchmark-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        game.seed_random(seed)
+        libtcod.set_default_keypress('a')
+        game.initialize_screen()
+        game.new_game()
+        game.key = libtcod.Key()
+        game.mouse = libtcod.Mouse()
+
+        started = time.time()
+        for (turn, char) in enumerate(script(turns, seed, descend_every)):
+            if char == '/':
+                # walk onto the stairs first, so every descent happens
+                game.player.set_position(game.downstairs.x, game.downstairs.y)
+            # keep the player alive so every turn exercises the monsters
+            game.player.fighter.hp = game.player.fighter.max_hp
+            libtcod.push_key(libtcod.KEY_CHAR, ord(char))
+            game.play_turn()
+            if save_every and (turn + 1) % save_every == 0:
+                game.save_game()
+        # let the last autosave finish before its files are cleaned up
+        game.save_worker.wait()
+        elapsed = time.time() - started
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors = True)
+        for (phase, name) in PHASES:
+            setattr(game, name, originals[name])
+
+    return {'seed': seed,
+            'turns': turns,
+            'descend_every': descend_every,
+            'save_every': save_every,
+            'python': platform.python_version(),
+            'seconds': elapsed,
+            'ms_per_turn': 1000.0 * elapsed / max(turns, 1),
+            'phases': timer.report(),
+            # the state the script ended in, so runs that should match can be
+            #   checked for having played the same game
+            'result': {'turn_counter': game.turn_counter,
+                       'dungeon_level': game.dungeon_level,
+                       'player_level': game.player.level,
+                       'xp': game.player.fighter.xp,
+                       'objects': len(game.objects)}}
+
+
+
+def save_scaling(depth, seed = 1, turns_per_floor = 20):
+    # build a dungeon depth floors deep, playing turns_per_floor scripted
+    #   turns on every floor so it gets explored and its monsters move, then
+    #   time saving it, loading it, and walking all the way up and back down.
+    #   save is the save the game would make (only the floors that changed
+    #   since the last autosave), save_all one after the walk, which has
+    #   touched every floor
+    timer = PhaseTimer()
+    workdir = tempfile.mkdtemp(prefix = 'lovecraftrl-benchmark-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        game.seed_random(seed)
+        libtcod.set_default_keypress('a')
+        game.initialize_screen()
+        game.new_game()
+        game.key = libtcod.Key()
+        game.mouse = libtcod.Mouse()
+
+        keys = script(turns_per_floor * depth, seed, 0)
+        generate = timer.wrap('generate', game.next_level)
+        for floor_num in range(depth):
+            if floor_num > 0:
+                generate()
+            for char in keys[floor_num * turns_per_floor:
+                             (floor_num + 1) * turns_per_floor]:
+                game.player.fighter.hp = game.player.fighter.max_hp
+                libtcod.push_key(libtcod.KEY_CHAR, ord(char))
+                game.play_turn()
+        game.save_worker.wait()
+
+        timer.wrap('save', game.save_game)()
+        saved_bytes = os.path.getsize(game.SAVE_FILE)
+        timer.wrap('load', game.load_game)()
+        prev_level = timer.wrap('prev_level', game.prev_level)
+        for floor_num in range(depth - 1):
+            prev_level()
+        next_level = timer.wrap('next_level', game.next_level)
+        for floor_num in range(depth - 1):
+            next_level()
+        timer.wrap('save_all', game.save_game)()
+
+        return {'depth': depth,
+                'phases': timer.report(),
+                'bytes': {'save_file': saved_bytes,
+                          'total': disk_usage(game.SAVE_DIR)},
+                'peak_rss': peak_rss()}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors = True)
+
+
+
+def save_scalings(depths, seed, turns_per_floor):
+    # run save_scaling for every depth, each in a fresh interpreter so its
+    #   peak memory use is its own
+    results = []
+    for depth in depths:
+        output = subprocess.check_output([sys.executable,
+                                          os.path.abspath(__file__),
+                                          '--saves-depth', str(depth),
+                                          '--seed', str(seed),
+                                          '--turns-per-floor',
+                                          str(turns_per_floor)])
+        results.append(json.loads(output.decode('utf-8')))
+    return {'seed': seed,
+            'turns_per_floor': turns_per_floor,
+            'python': platform.python_version(),
+            'saves': results}
+
+
+
+def disk_usage(path):
+    # the bytes taken by the files under a directory
+    total = 0
+    for (directory, subdirectories, files) in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+
+def peak_rss():
+    # the most memory the process has used so far, in bytes. None where it
+    #   can't be found out (the resource module is Unix only)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in kilobytes, except on the Mac
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+
+def startup(runs, backend):
+    # time the game's startup in runs fresh interpreters. the game is started
+    #   from its own directory, as libtcodpy loads the library from there
+    env = dict(os.environ)
+    env['LOVECRAFTRL_BACKEND'] = backend
+    directory = os.path.dirname(os.path.abspath(__file__))
+    seconds = []
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable, '-c',
+                                          STARTUP_SCRIPT],
+                                         cwd = directory, env = env)
+        seconds.append(float(output.decode('ascii').split()[-1]))
+    seconds.sort()
+    return {'backend': backend,
+            'runs': runs,
+            'seconds': seconds,
+            'min_seconds': seconds[0],
+            'median_seconds': seconds[len(seconds) // 2]}
+
+
+
+def compare(results, baseline, tolerance):
+    # list the phases that got slower than the baseline by more than the
+    #   tolerance (a fraction, e.g. 0.2 for 20%). startup is compared by its
+    #   fastest run, which is the least noisy, and save scaling phase by
+    #   phase for every depth both have
+    regressions = []
+    if ('startup' in results and 'startup' in baseline and
+        results['startup']['backend'] == baseline['startup']['backend']):
+        before = baseline['startup']['min_seconds']
+        after = results['startup']['min_seconds']
+        if before > 0 and after > before * (1 + tolerance):
+            regressions.append({'phase': 'startup',
+                                'baseline_ms': 1000.0 * before,
+                                'ms': 1000.0 * after,
+                                'ratio': after / before})
+    regressions.extend(compare_phases(results.get('phases', {}),
+                                      baseline.get('phases', {}),
+                                      tolerance))
+
+    baseline_depths = dict((depth['depth'], depth)
+                           for depth in baseline.get('saves', []))
+    for depth in results.get('saves', []):
+        if depth['depth'] in baseline_depths:
+            regressions.extend(compare_phases(
+                depth['phases'], baseline_depths[depth['depth']]['phases'],
+                tolerance, '%d floors: ' % depth['depth']))
+    return regressions
+
+
+
+def compare_phases(phases, baseline, tolerance, prefix = ''):
+    regressions = []
+    for (phase, timing) in sorted(phases.items()):
+        if phase not in baseline:
+            continue
+        before = baseline[phase]['ms_per_call']
+        after = timing['ms_per_call']
+        if before > 0 and after > before * (1 + tolerance):
+            regressions.append({'phase': prefix + phase, 'baseline_ms': before,
+                                'ms': after, 'ratio': after / before})
+    return regressions
+
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark LovecraftRL.')
+    parser.add_argument('--turns', type = int, default = 1000)
+    parser.add_argument('--seed', type = int, default = 1)
+    parser.add_argument('--descend-every', type = int, default = 200,
+                        help = 'take the stairs down every N turns (0: never)')
+    parser.add_argument('--save-every', type = int, default = 100,
+                        help = 'save the game every N turns (0: never)')
+    parser.add_argument('--output', help = 'write the JSON here, not stdout')
+    parser.add_argument('--baseline',
+                        help = 'JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type = float, default = 0.2,
+                        help = 'allowed slowdown per phase, as a fraction')
+    parser.add_argument('--startup', type = int, default = 0,
+                        help = 'time the game starting up N times')
+    parser.add_argument('--backend', choices = ['libtcod', 'headless'],
+                        default = BACKEND,
+                        help = 'backend to time the startup on')
+    parser.add_argument('--saves', action = 'store_true',
+                        help = 'time saving and loading dungeons of ' +
+                               'different depths instead')
+    parser.add_argument('--depths',
+                        default = ','.join(str(depth)
+                                           for depth in SAVE_DEPTHS),
+                        help = 'dungeon depths for --saves, e.g. 1,5,10')
+    parser.add_argument('--turns-per-floor', type = int, default = 20,
+                        help = 'turns played on every floor for --saves')
+    # runs one depth of --saves, in the interpreter save_scalings starts
+    parser.add_argument('--saves-depth', type = int,
+                        help = argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.saves_depth:
+        print(json.dumps(save_scaling(args.saves_depth, args.seed,
+                                      args.turns_per_floor)))
+        return 0
+
+    if args.saves:
+        depths = [int(depth) for depth in args.depths.split(',')]
+        results = save_scalings(depths, args.seed, args.turns_per_floor)
+    else:
+        results = run(args.turns, args.seed, args.descend_every,
+                      args.save_every)
+        if args.startup:
+            results['startup'] = startup(args.startup, args.backend)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        results['regressions'] = regressions
+
+    text = json.dumps(results, indent = 2, sort_keys = True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    return 1 if regressions else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,8 @@ from libtcodpy import Color
 # HACK for return types
 c_void = c_int
 
+# lib is libtcodpy's _LazyLibrary, so this only records the prototypes. each
+# one is set on its function when the function is first called
 def setup_protos(lib):
     lib.TCOD_line_step.restype = c_bool
     lib.TCOD_line_step.argtypes=[POINTER(c_int), POINTER(c_int)]
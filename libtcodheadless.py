@@ -0,0 +1,1389 @@
+#
+# headless libtcod backend for LovecraftRL
+#
+# a drop-in, pure-Python replacement for the parts of libtcodpy that the game
+# uses. consoles, FOV maps, paths and dijkstra maps are kept in plain in-memory
+# arrays and nothing is ever drawn to a window, so the game can be simulated
+# and profiled on machines that don't have libtcod or a display.
+#
+# select it by setting LOVECRAFTRL_BACKEND=headless before starting the game,
+# then feed it input with push_key() and push_mouse().
+#
+
+import heapq
+import random as _random
+import textwrap
+
+try:  #import NumPy if available
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+HEADLESS = True
+
+HEXVERSION = 0x010600
+STRVERSION = "1.6.0"
+TECHVERSION = 0x01060000
+
+############################
+# color module
+############################
+def _clamp(v):
+    return max(0, min(255, int(v)))
+
+class Color(object):
+    # plain python color with the same interface as libtcodpy.Color
+    __slots__ = ('r', 'g', 'b')
+
+    def __init__(self, r=0, g=0, b=0):
+        self.r = r
+        self.g = g
+        self.b = b
+
+    def __eq__(self, c):
+        return (self.r, self.g, self.b) == (c.r, c.g, c.b)
+
+    def __ne__(self, c):
+        return not self == c
+
+    def __hash__(self):
+        return hash((self.r, self.g, self.b))
+
+    def __mul__(self, c):
+        if isinstance(c, Color):
+            return Color(self.r * c.r // 255, self.g * c.g // 255,
+                         self.b * c.b // 255)
+        else:
+            return Color(_clamp(self.r * c), _clamp(self.g * c),
+                         _clamp(self.b * c))
+
+    def __add__(self, c):
+        return Color(_clamp(self.r + c.r), _clamp(self.g + c.g),
+                     _clamp(self.b + c.b))
+
+    def __sub__(self, c):
+        return Color(_clamp(self.r - c.r), _clamp(self.g - c.g),
+                     _clamp(self.b - c.b))
+
+    def __repr__(self):
+        return "Color(%d,%d,%d)" % (self.r, self.g, self.b)
+
+    def __getitem__(self, i):
+        if type(i) == str:
+            return getattr(self, i)
+        else:
+            return getattr(self, "rgb"[i])
+
+    def __setitem__(self, i, c):
+        if type(i) == str:
+            setattr(self, i, c)
+        else:
+            setattr(self, "rgb"[i], c)
+
+    def __iter__(self):
+        yield self.r
+        yield self.g
+        yield self.b
+
+    def __getstate__(self):
+        return (self.r, self.g, self.b)
+
+    def __setstate__(self, state):
+        self.r, self.g, self.b = state
+
+# default colors
+# grey levels
+black=Color(0,0,0)
+darkest_grey=Color(31,31,31)
+darker_grey=Color(63,63,63)
+dark_grey=Color(95,95,95)
+grey=Color(127,127,127)
+light_grey=Color(159,159,159)
+lighter_grey=Color(191,191,191)
+lightest_grey=Color(223,223,223)
+darkest_gray=Color(31,31,31)
+darker_gray=Color(63,63,63)
+dark_gray=Color(95,95,95)
+gray=Color(127,127,127)
+light_gray=Color(159,159,159)
+lighter_gray=Color(191,191,191)
+lightest_gray=Color(223,223,223)
+white=Color(255,255,255)
+
+# sepia
+darkest_sepia=Color(31,24,15)
+darker_sepia=Color(63,50,31)
+dark_sepia=Color(94,75,47)
+sepia=Color(127,101,63)
+light_sepia=Color(158,134,100)
+lighter_sepia=Color(191,171,143)
+lightest_sepia=Color(222,211,195)
+
+#standard colors
+red=Color(255,0,0)
+flame=Color(255,63,0)
+orange=Color(255,127,0)
+amber=Color(255,191,0)
+yellow=Color(255,255,0)
+lime=Color(191,255,0)
+chartreuse=Color(127,255,0)
+green=Color(0,255,0)
+sea=Color(0,255,127)
+turquoise=Color(0,255,191)
+cyan=Color(0,255,255)
+sky=Color(0,191,255)
+azure=Color(0,127,255)
+blue=Color(0,0,255)
+han=Color(63,0,255)
+violet=Color(127,0,255)
+purple=Color(191,0,255)
+fuchsia=Color(255,0,255)
+magenta=Color(255,0,191)
+pink=Color(255,0,127)
+crimson=Color(255,0,63)
+
+# dark colors
+dark_red=Color(191,0,0)
+dark_flame=Color(191,47,0)
+dark_orange=Color(191,95,0)
+dark_amber=Color(191,143,0)
+dark_yellow=Color(191,191,0)
+dark_lime=Color(143,191,0)
+dark_chartreuse=Color(95,191,0)
+dark_green=Color(0,191,0)
+dark_sea=Color(0,191,95)
+dark_turquoise=Color(0,191,143)
+dark_cyan=Color(0,191,191)
+dark_sky=Color(0,143,191)
+dark_azure=Color(0,95,191)
+dark_blue=Color(0,0,191)
+dark_han=Color(47,0,191)
+dark_violet=Color(95,0,191)
+dark_purple=Color(143,0,191)
+dark_fuchsia=Color(191,0,191)
+dark_magenta=Color(191,0,143)
+dark_pink=Color(191,0,95)
+dark_crimson=Color(191,0,47)
+
+# darker colors
+darker_red=Color(127,0,0)
+darker_flame=Color(127,31,0)
+darker_orange=Color(127,63,0)
+darker_amber=Color(127,95,0)
+darker_yellow=Color(127,127,0)
+darker_lime=Color(95,127,0)
+darker_chartreuse=Color(63,127,0)
+darker_green=Color(0,127,0)
+darker_sea=Color(0,127,63)
+darker_turquoise=Color(0,127,95)
+darker_cyan=Color(0,127,127)
+darker_sky=Color(0,95,127)
+darker_azure=Color(0,63,127)
+darker_blue=Color(0,0,127)
+darker_han=Color(31,0,127)
+darker_violet=Color(63,0,127)
+darker_purple=Color(95,0,127)
+darker_fuchsia=Color(127,0,127)
+darker_magenta=Color(127,0,95)
+darker_pink=Color(127,0,63)
+darker_crimson=Color(127,0,31)
+
+# darkest colors
+darkest_red=Color(63,0,0)
+darkest_flame=Color(63,15,0)
+darkest_orange=Color(63,31,0)
+darkest_amber=Color(63,47,0)
+darkest_yellow=Color(63,63,0)
+darkest_lime=Color(47,63,0)
+darkest_chartreuse=Color(31,63,0)
+darkest_green=Color(0,63,0)
+darkest_sea=Color(0,63,31)
+darkest_turquoise=Color(0,63,47)
+darkest_cyan=Color(0,63,63)
+darkest_sky=Color(0,47,63)
+darkest_azure=Color(0,31,63)
+darkest_blue=Color(0,0,63)
+darkest_han=Color(15,0,63)
+darkest_violet=Color(31,0,63)
+darkest_purple=Color(47,0,63)
+darkest_fuchsia=Color(63,0,63)
+darkest_magenta=Color(63,0,47)
+darkest_pink=Color(63,0,31)
+darkest_crimson=Color(63,0,15)
+
+# light colors
+light_red=Color(255,114,114)
+light_flame=Color(255,149,114)
+light_orange=Color(255,184,114)
+light_amber=Color(255,219,114)
+light_yellow=Color(255,255,114)
+light_lime=Color(219,255,114)
+light_chartreuse=Color(184,255,114)
+light_green=Color(114,255,114)
+light_sea=Color(114,255,184)
+light_turquoise=Color(114,255,219)
+light_cyan=Color(114,255,255)
+light_sky=Color(114,219,255)
+light_azure=Color(114,184,255)
+light_blue=Color(114,114,255)
+light_han=Color(149,114,255)
+light_violet=Color(184,114,255)
+light_purple=Color(219,114,255)
+light_fuchsia=Color(255,114,255)
+light_magenta=Color(255,114,219)
+light_pink=Color(255,114,184)
+light_crimson=Color(255,114,149)
+
+#lighter colors
+lighter_red=Color(255,165,165)
+lighter_flame=Color(255,188,165)
+lighter_orange=Color(255,210,165)
+lighter_amber=Color(255,232,165)
+lighter_yellow=Color(255,255,165)
+lighter_lime=Color(232,255,165)
+lighter_chartreuse=Color(210,255,165)
+lighter_green=Color(165,255,165)
+lighter_sea=Color(165,255,210)
+lighter_turquoise=Color(165,255,232)
+lighter_cyan=Color(165,255,255)
+lighter_sky=Color(165,232,255)
+lighter_azure=Color(165,210,255)
+lighter_blue=Color(165,165,255)
+lighter_han=Color(188,165,255)
+lighter_violet=Color(210,165,255)
+lighter_purple=Color(232,165,255)
+lighter_fuchsia=Color(255,165,255)
+lighter_magenta=Color(255,165,232)
+lighter_pink=Color(255,165,210)
+lighter_crimson=Color(255,165,188)
+
+# lightest colors
+lightest_red=Color(255,191,191)
+lightest_flame=Color(255,207,191)
+lightest_orange=Color(255,223,191)
+lightest_amber=Color(255,239,191)
+lightest_yellow=Color(255,255,191)
+lightest_lime=Color(239,255,191)
+lightest_chartreuse=Color(223,255,191)
+lightest_green=Color(191,255,191)
+lightest_sea=Color(191,255,223)
+lightest_turquoise=Color(191,255,239)
+lightest_cyan=Color(191,255,255)
+lightest_sky=Color(191,239,255)
+lightest_azure=Color(191,223,255)
+lightest_blue=Color(191,191,255)
+lightest_han=Color(207,191,255)
+lightest_violet=Color(223,191,255)
+lightest_purple=Color(239,191,255)
+lightest_fuchsia=Color(255,191,255)
+lightest_magenta=Color(255,191,239)
+lightest_pink=Color(255,191,223)
+lightest_crimson=Color(255,191,207)
+
+# desaturated colors
+desaturated_red=Color(127,63,63)
+desaturated_flame=Color(127,79,63)
+desaturated_orange=Color(127,95,63)
+desaturated_amber=Color(127,111,63)
+desaturated_yellow=Color(127,127,63)
+desaturated_lime=Color(111,127,63)
+desaturated_chartreuse=Color(95,127,63)
+desaturated_green=Color(63,127,63)
+desaturated_sea=Color(63,127,95)
+desaturated_turquoise=Color(63,127,111)
+desaturated_cyan=Color(63,127,127)
+desaturated_sky=Color(63,111,127)
+desaturated_azure=Color(63,95,127)
+desaturated_blue=Color(63,63,127)
+desaturated_han=Color(79,63,127)
+desaturated_violet=Color(95,63,127)
+desaturated_purple=Color(111,63,127)
+desaturated_fuchsia=Color(127,63,127)
+desaturated_magenta=Color(127,63,111)
+desaturated_pink=Color(127,63,95)
+desaturated_crimson=Color(127,63,79)
+
+# metallic
+brass=Color(191,151,96)
+copper=Color(197,136,124)
+gold=Color(229,191,0)
+silver=Color(203,203,203)
+
+# miscellaneous
+celadon=Color(172,255,175)
+peach=Color(255,159,127)
+
+############################
+# console constants
+############################
+# background rendering modes
+BKGND_NONE = 0
+BKGND_SET = 1
+BKGND_MULTIPLY = 2
+BKGND_LIGHTEN = 3
+BKGND_DARKEN = 4
+BKGND_SCREEN = 5
+BKGND_COLOR_DODGE = 6
+BKGND_COLOR_BURN = 7
+BKGND_ADD = 8
+BKGND_ADDA = 9
+BKGND_BURN = 10
+BKGND_OVERLAY = 11
+BKGND_ALPH = 12
+BKGND_DEFAULT=13
+
+def BKGND_ALPHA(a):
+    return BKGND_ALPH | (int(a * 255) << 8)
+
+def BKGND_ADDALPHA(a):
+    return BKGND_ADDA | (int(a * 255) << 8)
+
+# non blocking key events types
+KEY_PRESSED = 1
+KEY_RELEASED = 2
+# key codes
+KEY_NONE = 0
+KEY_ESCAPE = 1
+KEY_BACKSPACE = 2
+KEY_TAB = 3
+KEY_ENTER = 4
+KEY_SHIFT = 5
+KEY_CONTROL = 6
+KEY_ALT = 7
+KEY_PAUSE = 8
+KEY_CAPSLOCK = 9
+KEY_PAGEUP = 10
+KEY_PAGEDOWN = 11
+KEY_END = 12
+KEY_HOME = 13
+KEY_UP = 14
+KEY_LEFT = 15
+KEY_RIGHT = 16
+KEY_DOWN = 17
+KEY_PRINTSCREEN = 18
+KEY_INSERT = 19
+KEY_DELETE = 20
+KEY_LWIN = 21
+KEY_RWIN = 22
+KEY_APPS = 23
+KEY_0 = 24
+KEY_1 = 25
+KEY_2 = 26
+KEY_3 = 27
+KEY_4 = 28
+KEY_5 = 29
+KEY_6 = 30
+KEY_7 = 31
+KEY_8 = 32
+KEY_9 = 33
+KEY_KP0 = 34
+KEY_KP1 = 35
+KEY_KP2 = 36
+KEY_KP3 = 37
+KEY_KP4 = 38
+KEY_KP5 = 39
+KEY_KP6 = 40
+KEY_KP7 = 41
+KEY_KP8 = 42
+KEY_KP9 = 43
+KEY_KPADD = 44
+KEY_KPSUB = 45
+KEY_KPDIV = 46
+KEY_KPMUL = 47
+KEY_KPDEC = 48
+KEY_KPENTER = 49
+KEY_F1 = 50
+KEY_F2 = 51
+KEY_F3 = 52
+KEY_F4 = 53
+KEY_F5 = 54
+KEY_F6 = 55
+KEY_F7 = 56
+KEY_F8 = 57
+KEY_F9 = 58
+KEY_F10 = 59
+KEY_F11 = 60
+KEY_F12 = 61
+KEY_NUMLOCK = 62
+KEY_SCROLLLOCK = 63
+KEY_SPACE = 64
+KEY_CHAR = 65
+# special chars
+# single walls
+CHAR_HLINE = 196
+CHAR_VLINE = 179
+CHAR_NE = 191
+CHAR_NW = 218
+CHAR_SE = 217
+CHAR_SW = 192
+CHAR_TEEW = 180
+CHAR_TEEE = 195
+CHAR_TEEN = 193
+CHAR_TEES = 194
+CHAR_CROSS = 197
+# double walls
+CHAR_DHLINE = 205
+CHAR_DVLINE = 186
+CHAR_DNE = 187
+CHAR_DNW = 201
+CHAR_DSE = 188
+CHAR_DSW = 200
+CHAR_DTEEW = 185
+CHAR_DTEEE = 204
+CHAR_DTEEN = 202
+CHAR_DTEES = 203
+CHAR_DCROSS = 206
+# blocks
+CHAR_BLOCK1 = 176
+CHAR_BLOCK2 = 177
+CHAR_BLOCK3 = 178
+# arrows
+CHAR_ARROW_N = 24
+CHAR_ARROW_S = 25
+CHAR_ARROW_E = 26
+CHAR_ARROW_W = 27
+# arrows without tail
+CHAR_ARROW2_N = 30
+CHAR_ARROW2_S = 31
+CHAR_ARROW2_E = 16
+CHAR_ARROW2_W = 17
+# double arrows
+CHAR_DARROW_H = 29
+CHAR_DARROW_V = 18
+# GUI stuff
+CHAR_CHECKBOX_UNSET = 224
+CHAR_CHECKBOX_SET = 225
+CHAR_RADIO_UNSET = 9
+CHAR_RADIO_SET = 10
+# sub-pixel resolution kit
+CHAR_SUBP_NW = 226
+CHAR_SUBP_NE = 227
+CHAR_SUBP_N = 228
+CHAR_SUBP_SE = 229
+CHAR_SUBP_DIAG = 230
+CHAR_SUBP_E = 231
+CHAR_SUBP_SW = 232
+# misc characters
+CHAR_BULLET = 7
+CHAR_BULLET_INV = 8
+CHAR_BULLET_SQUARE = 254
+CHAR_CENT = 189
+CHAR_CLUB = 5
+CHAR_COPYRIGHT = 184
+CHAR_CURRENCY = 207
+CHAR_DIAMOND = 4
+CHAR_DIVISION = 246
+CHAR_EXCLAM_DOUBLE = 19
+CHAR_FEMALE = 12
+CHAR_FUNCTION = 159
+CHAR_GRADE = 248
+CHAR_HALF = 171
+CHAR_HEART = 3
+CHAR_LIGHT = 15
+CHAR_MALE = 11
+CHAR_MULTIPLICATION = 158
+CHAR_NOTE = 13
+CHAR_NOTE_DOUBLE = 14
+CHAR_ONE_QUARTER = 172
+CHAR_PILCROW = 20
+CHAR_POUND = 156
+CHAR_POW1 = 251
+CHAR_POW2 = 253
+CHAR_POW3 = 252
+CHAR_RESERVED = 169
+CHAR_SECTION = 21
+CHAR_SMILIE = 1
+CHAR_SMILIE_INV = 2
+CHAR_SPADE = 6
+CHAR_THREE_QUARTERS = 243
+CHAR_UMLAUT = 249
+CHAR_YEN = 190
+# font flags
+FONT_LAYOUT_ASCII_INCOL = 1
+FONT_LAYOUT_ASCII_INROW = 2
+FONT_TYPE_GREYSCALE = 4
+FONT_TYPE_GRAYSCALE = 4
+FONT_LAYOUT_TCOD = 8
+# color control codes
+COLCTRL_1=1
+COLCTRL_2=2
+COLCTRL_3=3
+COLCTRL_4=4
+COLCTRL_5=5
+COLCTRL_NUMBER=5
+COLCTRL_FORE_RGB=6
+COLCTRL_BACK_RGB=7
+COLCTRL_STOP=8
+# renderers
+RENDERER_GLSL=0
+RENDERER_OPENGL=1
+RENDERER_SDL=2
+NB_RENDERERS=3
+# alignment
+LEFT=0
+RIGHT=1
+CENTER=2
+
+# color functions
+def color_lerp(c1, c2, a):
+    return Color(_clamp(c1.r + (c2.r - c1.r) * a),
+                 _clamp(c1.g + (c2.g - c1.g) * a),
+                 _clamp(c1.b + (c2.b - c1.b) * a))
+
+############################
+# console module
+############################
+class Key(object):
+    # same fields as libtcodpy.Key
+    def __init__(self, vk=0, c=0, pressed=False, lalt=False, lctrl=False,
+                 ralt=False, rctrl=False, shift=False):
+        self.vk = vk
+        self.c = c
+        self.text = ''
+        self.pressed = pressed
+        self.lalt = lalt
+        self.lctrl = lctrl
+        self.ralt = ralt
+        self.rctrl = rctrl
+        self.shift = shift
+
+class Mouse(object):
+    # same fields as libtcodpy.Mouse
+    def __init__(self):
+        self.x = self.y = self.dx = self.dy = 0
+        self.cx = self.cy = self.dcx = self.dcy = 0
+        self.lbutton = self.rbutton = self.mbutton = False
+        self.lbutton_pressed = self.rbutton_pressed = False
+        self.mbutton_pressed = False
+        self.wheel_up = self.wheel_down = False
+
+class _Console(object):
+    # an off-screen console: one character and two colors per cell, stored
+    #   row by row like libtcod does
+    def __init__(self, w, h):
+        self.width = w
+        self.height = h
+        self.default_fg = (255, 255, 255)
+        self.default_bg = (0, 0, 0)
+        self.clear()
+
+    def clear(self):
+        n = self.width * self.height
+        self.char = [ord(' ')] * n
+        self.fg = [self.default_fg] * n
+        self.bg = [self.default_bg] * n
+
+    def contains(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def put(self, x, y, c, fg=None, bg=None):
+        if self.contains(x, y):
+            i = x + y * self.width
+            self.char[i] = c
+            if fg is not None:
+                self.fg[i] = fg
+            if bg is not None:
+                self.bg[i] = bg
+
+_root = None
+_fullscreen = False
+_frames = 0
+
+def _con(con):
+    # console 0 is the root console, like in libtcod
+    if not con:
+        return _root
+    return con
+
+def _ord(c):
+    if type(c) == str or type(c) == bytes:
+        return ord(c)
+    return c
+
+def _rgb(col):
+    return (col.r, col.g, col.b)
+
+def _text(fmt):
+    if type(fmt) == bytes and str is not bytes:
+        return fmt.decode('latin-1')
+    return fmt
+
+def console_init_root(w, h, title, fullscreen=False, renderer=RENDERER_SDL):
+    global _root, _fullscreen, _window_closed
+    _root = _Console(w, h)
+    _fullscreen = fullscreen
+    _window_closed = False
+
+def console_get_width(con):
+    return _con(con).width
+
+def console_get_height(con):
+    return _con(con).height
+
+def console_set_custom_font(fontFile, flags=FONT_LAYOUT_ASCII_INCOL, nb_char_horiz=0, nb_char_vertic=0):
+    pass
+
+def console_is_fullscreen():
+    return _fullscreen
+
+def console_set_fullscreen(fullscreen):
+    global _fullscreen
+    _fullscreen = bool(fullscreen)
+
+def console_set_window_title(title):
+    pass
+
+def console_flush():
+    global _frames
+    _frames += 1
+
+def console_set_default_background(con, col):
+    _con(con).default_bg = _rgb(col)
+
+def console_set_default_foreground(con, col):
+    _con(con).default_fg = _rgb(col)
+
+def console_get_default_background(con):
+    return Color(*_con(con).default_bg)
+
+def console_get_default_foreground(con):
+    return Color(*_con(con).default_fg)
+
+def console_clear(con):
+    _con(con).clear()
+
+def console_put_char(con, x, y, c, flag=BKGND_DEFAULT):
+    con = _con(con)
+    bg = con.default_bg if flag != BKGND_NONE else None
+    con.put(x, y, _ord(c), con.default_fg, bg)
+
+def console_put_char_ex(con, x, y, c, fore, back):
+    con = _con(con)
+    if 0 <= x < con.width and 0 <= y < con.height:
+        i = x + y * con.width
+        con.char[i] = _ord(c)
+        con.fg[i] = (fore.r, fore.g, fore.b)
+        con.bg[i] = (back.r, back.g, back.b)
+
+def console_set_char_background(con, x, y, col, flag=BKGND_SET):
+    con = _con(con)
+    if flag != BKGND_NONE and con.contains(x, y):
+        con.bg[x + y * con.width] = _rgb(col)
+
+def console_set_char_foreground(con, x, y, col):
+    con = _con(con)
+    if con.contains(x, y):
+        con.fg[x + y * con.width] = _rgb(col)
+
+def console_set_char(con, x, y, c):
+    _con(con).put(x, y, _ord(c))
+
+def console_get_char_background(con, x, y):
+    con = _con(con)
+    return Color(*con.bg[x + y * con.width])
+
+def console_get_char_foreground(con, x, y):
+    con = _con(con)
+    return Color(*con.fg[x + y * con.width])
+
+def console_get_char(con, x, y):
+    con = _con(con)
+    return con.char[x + y * con.width]
+
+def _print_line(con, x, y, flag, alignment, line):
+    if alignment == CENTER:
+        x -= len(line) // 2
+    elif alignment == RIGHT:
+        x -= len(line) - 1
+    bg = con.default_bg if flag != BKGND_NONE else None
+    for i, c in enumerate(line):
+        con.put(int(x) + i, int(y), ord(c), con.default_fg, bg)
+
+def _wrap(fmt, w):
+    lines = []
+    for paragraph in _text(fmt).split('\n'):
+        lines.extend(textwrap.wrap(paragraph, w) or [''])
+    return lines
+
+def console_print(con, x, y, fmt):
+    con = _con(con)
+    _print_line(con, x, y, BKGND_NONE, LEFT, _text(fmt))
+
+def console_print_ex(con, x, y, flag, alignment, fmt):
+    _print_line(_con(con), x, y, flag, alignment, _text(fmt))
+
+def console_print_rect(con, x, y, w, h, fmt):
+    return console_print_rect_ex(con, x, y, w, h, BKGND_NONE, LEFT, fmt)
+
+def console_print_rect_ex(con, x, y, w, h, flag, alignment, fmt):
+    con = _con(con)
+    lines = _wrap(fmt, w or con.width - x)
+    if h:
+        lines = lines[:h]
+    for i, line in enumerate(lines):
+        _print_line(con, x, y + i, flag, alignment, line)
+    return len(lines)
+
+def console_get_height_rect(con, x, y, w, h, fmt):
+    lines = len(_wrap(fmt, w or _con(con).width - x))
+    if h:
+        return min(lines, h)
+    return lines
+
+def console_rect(con, x, y, w, h, clr, flag=BKGND_DEFAULT):
+    con = _con(con)
+    for cy in range(y, y + h):
+        for cx in range(x, x + w):
+            if con.contains(cx, cy):
+                i = cx + cy * con.width
+                if clr:
+                    con.char[i] = ord(' ')
+                if flag != BKGND_NONE:
+                    con.bg[i] = con.default_bg
+
+def console_new(w, h):
+    return _Console(w, h)
+
+def console_delete(con):
+    pass
+
+def console_blit(src, x, y, w, h, dst, xdst, ydst, ffade=1.0,bfade=1.0):
+    src = _con(src)
+    dst = _con(dst)
+    if w == 0:
+        w = src.width
+    if h == 0:
+        h = src.height
+    # clip the rectangle to both consoles, then copy it row by row
+    if x < 0:
+        w += x
+        xdst -= x
+        x = 0
+    if xdst < 0:
+        w += xdst
+        x -= xdst
+        xdst = 0
+    w = min(w, src.width - x, dst.width - xdst)
+    for cy in range(h):
+        sy = y + cy
+        dy = ydst + cy
+        if w <= 0 or not (0 <= sy < src.height and 0 <= dy < dst.height):
+            continue
+        i = x + sy * src.width
+        j = xdst + dy * dst.width
+        dst.char[j:j + w] = src.char[i:i + w]
+        dst.fg[j:j + w] = src.fg[i:i + w]
+        dst.bg[j:j + w] = src.bg[i:i + w]
+
+# fast color filling
+def _tolist(arr):
+    if numpy_available and isinstance(arr, numpy.ndarray):
+        return arr.ravel().tolist()
+    return list(arr)
+
+def console_fill_foreground(con,r,g,b) :
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    con = _con(con)
+    con.fg = list(zip(_tolist(r), _tolist(g), _tolist(b)))
+
+def console_fill_background(con,r,g,b) :
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+    con = _con(con)
+    con.bg = list(zip(_tolist(r), _tolist(g), _tolist(b)))
+
+def console_fill_char(con,arr) :
+    _con(con).char = _tolist(arr)
+
+############################
+# input
+############################
+# scripted input. events are consumed in order by sys_check_for_event and
+#   console_wait_for_keypress; once the queue runs dry the window reports
+#   itself as closed so that the game loops end
+_events = []
+_window_closed = False
+_close_when_idle = True
+_default_keypress = None
+
+def push_key(vk=KEY_CHAR, c=0, **kwargs):
+    # queue a key press. c may be given as a one-character string
+    if type(c) == str or type(c) == bytes:
+        c = ord(c)
+    _events.append(('key', Key(vk, c, True, **kwargs)))
+
+def push_mouse(cx, cy, lbutton_pressed=False, rbutton_pressed=False):
+    # queue a mouse event at console cell (cx, cy)
+    m = Mouse()
+    m.cx = cx
+    m.cy = cy
+    m.lbutton_pressed = lbutton_pressed
+    m.rbutton_pressed = rbutton_pressed
+    _events.append(('mouse', m))
+
+def clear_events():
+    del _events[:]
+
+def pending_events():
+    return len(_events)
+
+def set_close_when_idle(close):
+    global _close_when_idle
+    _close_when_idle = close
+
+def set_default_keypress(c):
+    # key returned by console_wait_for_keypress when no input is queued (for
+    #   instance, to answer level-up menus during a simulation)
+    global _default_keypress
+    _default_keypress = c
+
+def close_window():
+    global _window_closed
+    _window_closed = True
+
+def console_is_window_closed():
+    return _window_closed or (_close_when_idle and not _events)
+
+def console_has_mouse_focus():
+    return True
+
+def console_is_active():
+    return True
+
+def _copy_key(src, dst):
+    dst.vk = src.vk
+    dst.c = src.c
+    dst.pressed = src.pressed
+    dst.lalt = src.lalt
+    dst.lctrl = src.lctrl
+    dst.ralt = src.ralt
+    dst.rctrl = src.rctrl
+    dst.shift = src.shift
+
+def _copy_mouse(src, dst):
+    for name in ('cx', 'cy', 'lbutton_pressed', 'rbutton_pressed'):
+        setattr(dst, name, getattr(src, name))
+
+def console_wait_for_keypress(flush):
+    while _events:
+        kind, event = _events.pop(0)
+        if kind == 'key':
+            return event
+    k = Key()
+    if _default_keypress is not None:
+        k.vk = KEY_CHAR
+        k.c = ord(_default_keypress)
+    return k
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    if _events and _events[0][0] == 'key':
+        return _events.pop(0)[1]
+    return Key()
+
+def console_is_key_pressed(key):
+    return False
+
+def console_set_keyboard_repeat(initial_delay, interval):
+    pass
+
+def console_disable_keyboard_repeat():
+    pass
+
+############################
+# sys module
+############################
+_fps = 0
+
+def sys_set_fps(fps):
+    global _fps
+    _fps = fps
+
+def sys_get_fps():
+    return _fps
+
+def sys_get_last_frame_length():
+    return 0.0
+
+def sys_sleep_milli(val):
+    pass
+
+def sys_elapsed_milli():
+    return 0
+
+def sys_elapsed_seconds():
+    return 0.0
+
+def sys_set_renderer(renderer):
+    pass
+
+def sys_get_renderer():
+    return RENDERER_SDL
+
+# events
+EVENT_NONE=0
+EVENT_KEY_PRESS=1
+EVENT_KEY_RELEASE=2
+EVENT_KEY=EVENT_KEY_PRESS|EVENT_KEY_RELEASE
+EVENT_MOUSE_MOVE=4
+EVENT_MOUSE_PRESS=8
+EVENT_MOUSE_RELEASE=16
+EVENT_MOUSE=EVENT_MOUSE_MOVE|EVENT_MOUSE_PRESS|EVENT_MOUSE_RELEASE
+EVENT_ANY=EVENT_KEY|EVENT_MOUSE
+
+def sys_check_for_event(mask,k,m) :
+    # like libtcod, the key and mouse are reset when nothing happened
+    _copy_key(Key(), k)
+    m.lbutton_pressed = m.rbutton_pressed = m.mbutton_pressed = False
+    if not _events:
+        return EVENT_NONE
+    kind, event = _events.pop(0)
+    if kind == 'key':
+        _copy_key(event, k)
+        return EVENT_KEY_PRESS
+    _copy_mouse(event, m)
+    return EVENT_MOUSE_PRESS
+
+def sys_wait_for_event(mask,k,m,flush) :
+    return sys_check_for_event(mask, k, m)
+
+############################
+# image module
+############################
+def image_load(filename):
+    return None
+
+def image_blit_2x(image, console, dx, dy, sx=0, sy=0, w=-1, h=-1):
+    pass
+
+def image_delete(image):
+    pass
+
+############################
+# random module
+############################
+RNG_MT = 0
+RNG_CMWC = 1
+
+DISTRIBUTION_LINEAR = 0
+
+_default_rng = _random.Random()
+
+def _rng(rnd):
+    if not rnd:
+        return _default_rng
+    return rnd
+
+def random_get_instance():
+    return _default_rng
+
+def random_new(algo=RNG_CMWC):
+    return _random.Random()
+
+def random_new_from_seed(seed, algo=RNG_CMWC):
+    return _random.Random(seed)
+
+def random_set_distribution(rnd, dist) :
+    pass
+
+def random_get_int(rnd, mi, ma):
+    if mi > ma:
+        mi, ma = ma, mi
+    return _rng(rnd).randint(mi, ma)
+
+def random_get_float(rnd, mi, ma):
+    return _rng(rnd).uniform(mi, ma)
+
+def random_get_double(rnd, mi, ma):
+    return _rng(rnd).uniform(mi, ma)
+
+def random_save(rnd):
+    backup = _random.Random()
+    backup.setstate(_rng(rnd).getstate())
+    return backup
+
+def random_restore(rnd, backup):
+    _rng(rnd).setstate(backup.getstate())
+
+def random_delete(rnd):
+    pass
+
+############################
+# fov module
+############################
+FOV_BASIC = 0
+FOV_DIAMOND = 1
+FOV_SHADOW = 2
+FOV_PERMISSIVE_0 = 3
+FOV_PERMISSIVE_8 = 11
+FOV_RESTRICTIVE = 12
+NB_FOV_ALGORITHMS = 13
+
+class _Map(object):
+    # the same three flags per cell as libtcod's map_t, stored row by row
+    def __init__(self, w, h):
+        self.width = w
+        self.height = h
+        self.nbcells = w * h
+        self.transparent = bytearray(self.nbcells)
+        self.walkable = bytearray(self.nbcells)
+        self.fov = bytearray(self.nbcells)
+
+def map_new(w, h):
+    return _Map(w, h)
+
+def map_copy(source, dest):
+    dest.width = source.width
+    dest.height = source.height
+    dest.nbcells = source.nbcells
+    dest.transparent = bytearray(source.transparent)
+    dest.walkable = bytearray(source.walkable)
+    dest.fov = bytearray(source.fov)
+
+def map_set_properties(m, x, y, isTrans, isWalk):
+    if 0 <= x < m.width and 0 <= y < m.height:
+        i = x + y * m.width
+        m.transparent[i] = 1 if isTrans else 0
+        m.walkable[i] = 1 if isWalk else 0
+
+def map_clear(m,walkable=False,transparent=False):
+    m.transparent = bytearray([1 if transparent else 0]) * m.nbcells
+    m.walkable = bytearray([1 if walkable else 0]) * m.nbcells
+    m.fov = bytearray(m.nbcells)
+
+def _cast_ray(m, xo, yo, xd, yd, r2, light_walls):
+    # bresenham ray from the origin, following libtcod's circular raycasting
+    width = m.width
+    transparent = m.transparent
+    fov = m.fov
+    dx = xd - xo
+    dy = yd - yo
+    stepx = (dx > 0) - (dx < 0)
+    stepy = (dy > 0) - (dy < 0)
+    major_x = stepx * dx > stepy * dy
+    e = stepx * dx if major_x else stepy * dy
+    dx *= 2
+    dy *= 2
+    x, y = xo, yo
+    inside = False
+    blocked = False
+    offset = x + y * width
+    if 0 <= offset < m.nbcells:
+        inside = True
+        fov[offset] = 1
+    while True:
+        if major_x:
+            if x == xd:
+                return
+            x += stepx
+            e -= stepy * dy
+            if e < 0:
+                y += stepy
+                e += stepx * dx
+        else:
+            if y == yd:
+                return
+            y += stepy
+            e -= stepx * dx
+            if e < 0:
+                x += stepx
+                e += stepy * dy
+        if r2 > 0 and (x - xo) ** 2 + (y - yo) ** 2 > r2:
+            return
+        offset = x + y * width
+        if 0 <= offset < m.nbcells:
+            inside = True
+            if not blocked and not transparent[offset]:
+                blocked = True
+            elif blocked:
+                return
+            if light_walls or not blocked:
+                fov[offset] = 1
+        elif inside:
+            return
+
+def _postproc(m, x0, y0, x1, y1, dx, dy):
+    # light the walls next to visible floor that the rays missed
+    width = m.width
+    transparent = m.transparent
+    fov = m.fov
+    for cx in range(x0, x1 + 1):
+        for cy in range(y0, y1 + 1):
+            offset = cx + cy * width
+            if not (0 <= offset < m.nbcells and fov[offset] and
+                    transparent[offset]):
+                continue
+            x2 = cx + dx
+            y2 = cy + dy
+            if x0 <= x2 <= x1:
+                offset2 = x2 + cy * width
+                if 0 <= offset2 < m.nbcells and not transparent[offset2]:
+                    fov[offset2] = 1
+            if y0 <= y2 <= y1:
+                offset2 = cx + y2 * width
+                if 0 <= offset2 < m.nbcells and not transparent[offset2]:
+                    fov[offset2] = 1
+            if x0 <= x2 <= x1 and y0 <= y2 <= y1:
+                offset2 = x2 + y2 * width
+                if 0 <= offset2 < m.nbcells and not transparent[offset2]:
+                    fov[offset2] = 1
+
+def map_compute_fov(m, x, y, radius=0, light_walls=True, algo=FOV_RESTRICTIVE ):
+    # every algorithm is computed with libtcod's FOV_BASIC raycasting
+    m.fov = bytearray(m.nbcells)
+    xmin, ymin, xmax, ymax = 0, 0, m.width, m.height
+    if radius > 0:
+        xmin = max(0, x - radius)
+        ymin = max(0, y - radius)
+        xmax = min(m.width, x + radius + 1)
+        ymax = min(m.height, y + radius + 1)
+    r2 = radius * radius
+    for xo in range(xmin, xmax):
+        _cast_ray(m, x, y, xo, ymin, r2, light_walls)
+    for yo in range(ymin + 1, ymax):
+        _cast_ray(m, x, y, xmax - 1, yo, r2, light_walls)
+    for xo in range(xmax - 2, -1, -1):
+        _cast_ray(m, x, y, xo, ymax - 1, r2, light_walls)
+    for yo in range(ymax - 2, 0, -1):
+        _cast_ray(m, x, y, xmin, yo, r2, light_walls)
+    if light_walls:
+        _postproc(m, xmin, ymin, x, y, -1, -1)
+        _postproc(m, x, ymin, xmax - 1, y, 1, -1)
+        _postproc(m, xmin, y, x, ymax - 1, -1, 1)
+        _postproc(m, x, y, xmax - 1, ymax - 1, 1, 1)
+
+def map_is_in_fov(m, x, y):
+    if 0 <= x < m.width and 0 <= y < m.height:
+        return bool(m.fov[x + y * m.width])
+    return False
+
+def map_set_arrays(m, transparent, walkable):
+    # see libtcodpy.map_set_arrays
+    if numpy_available:
+        transparent = bytearray((numpy.ravel(transparent, order='F') != 0)
+                                .astype(numpy.uint8).tobytes())
+        walkable = bytearray((numpy.ravel(walkable, order='F') != 0)
+                             .astype(numpy.uint8).tobytes())
+    else:
+        transparent = bytearray(1 if t else 0 for t in transparent)
+        walkable = bytearray(1 if w else 0 for w in walkable)
+    if len(transparent) != m.nbcells or len(walkable) != m.nbcells:
+        raise ValueError('expected %d cells' % m.nbcells)
+    m.transparent = transparent
+    m.walkable = walkable
+    m.fov = bytearray(m.nbcells)
+
+def map_fov_array(m):
+    # see libtcodpy.map_fov_array
+    if numpy_available:
+        flags = numpy.frombuffer(m.fov, dtype=numpy.uint8)
+        return (flags != 0).reshape((m.width, m.height), order='F')
+    return bytearray(m.fov)
+
+def map_is_transparent(m, x, y):
+    if 0 <= x < m.width and 0 <= y < m.height:
+        return bool(m.transparent[x + y * m.width])
+    return False
+
+def map_is_walkable(m, x, y):
+    if 0 <= x < m.width and 0 <= y < m.height:
+        return bool(m.walkable[x + y * m.width])
+    return False
+
+def map_delete(m):
+    pass
+
+def map_get_width(map):
+    return map.width
+
+def map_get_height(map):
+    return map.height
+
+############################
+# pathfinding module
+############################
+_NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1),
+               (-1, -1), (1, -1), (-1, 1), (1, 1))
+
+class _Path(object):
+    def __init__(self, m, dcost):
+        self.map = m
+        self.dcost = dcost
+        self.origin = (0, 0)
+        self.destination = (0, 0)
+        # remaining steps, stored last step first so walking pops the end
+        self.steps = []
+
+def path_new_using_map(m, dcost=1.41):
+    return _Path(m, dcost)
+
+def path_compute(p, ox, oy, dx, dy):
+    m = p.map
+    p.origin = (ox, oy)
+    p.destination = (dx, dy)
+    p.steps = []
+    if (ox, oy) == (dx, dy) or not map_is_walkable(m, dx, dy):
+        return False
+    width = m.width
+    walkable = m.walkable
+    start = ox + oy * width
+    goal = dx + dy * width
+    dist = {start: 0.0}
+    came_from = {}
+    heap = [(0.0, start)]
+    while heap:
+        _, cur = heapq.heappop(heap)
+        if cur == goal:
+            break
+        cx = cur % width
+        cy = cur // width
+        cur_dist = dist[cur]
+        for i, (nx, ny) in enumerate(_NEIGHBOURS):
+            if i >= 4 and not p.dcost:
+                break
+            x = cx + nx
+            y = cy + ny
+            if not (0 <= x < width and 0 <= y < m.height):
+                continue
+            nxt = x + y * width
+            if not walkable[nxt]:
+                continue
+            new_dist = cur_dist + (p.dcost if i >= 4 else 1.0)
+            if new_dist < dist.get(nxt, new_dist + 1):
+                dist[nxt] = new_dist
+                came_from[nxt] = cur
+                h = max(abs(x - dx), abs(y - dy))
+                heapq.heappush(heap, (new_dist + h, nxt))
+    if goal not in came_from:
+        return False
+    cur = goal
+    while cur != start:
+        p.steps.append((cur % width, cur // width))
+        cur = came_from[cur]
+    return True
+
+def path_get_origin(p):
+    return p.origin
+
+def path_get_destination(p):
+    return p.destination
+
+def path_size(p):
+    return len(p.steps)
+
+def path_reverse(p):
+    # the old origin becomes the last step, the old destination the start
+    p.origin, p.destination = p.destination, p.origin
+    if p.steps:
+        p.steps = [p.destination] + p.steps[::-1][:-1]
+
+def path_get(p, idx):
+    return p.steps[len(p.steps) - 1 - idx]
+
+def path_is_empty(p):
+    return not p.steps
+
+def path_walk(p, recompute):
+    if p.steps:
+        x, y = p.steps[-1]
+        if map_is_walkable(p.map, x, y):
+            p.origin = p.steps.pop()
+            return x, y
+        if recompute and path_compute(p, p.origin[0], p.origin[1],
+                                      p.destination[0], p.destination[1]):
+            p.origin = p.steps.pop()
+            return p.origin
+    return None,None
+
+def path_delete(p):
+    pass
+
+class _Dijkstra(object):
+    def __init__(self, m, dcost):
+        self.map = m
+        self.dcost = dcost
+        self.root = None
+        self.distances = {}
+        self.steps = []
+
+def dijkstra_new(m, dcost=1.41):
+    return _Dijkstra(m, dcost)
+
+def dijkstra_compute(p, ox, oy):
+    m = p.map
+    width = m.width
+    walkable = m.walkable
+    start = ox + oy * width
+    p.root = (ox, oy)
+    dist = {start: 0.0}
+    heap = [(0.0, start)]
+    while heap:
+        cur_dist, cur = heapq.heappop(heap)
+        if cur_dist > dist[cur]:
+            continue
+        cx = cur % width
+        cy = cur // width
+        for i, (nx, ny) in enumerate(_NEIGHBOURS):
+            if i >= 4 and not p.dcost:
+                break
+            x = cx + nx
+            y = cy + ny
+            if not (0 <= x < width and 0 <= y < m.height):
+                continue
+            nxt = x + y * width
+            if not walkable[nxt]:
+                continue
+            new_dist = cur_dist + (p.dcost if i >= 4 else 1.0)
+            if new_dist < dist.get(nxt, new_dist + 1):
+                dist[nxt] = new_dist
+                heapq.heappush(heap, (new_dist, nxt))
+    p.distances = dist
+    p.steps = []
+
+def dijkstra_get_distance(p, x, y):
+    return p.distances.get(x + y * p.map.width, -1.0)
+
+def dijkstra_path_set(p, x, y):
+    # the path goes from the root to (x, y). find it by walking downhill from
+    #   (x, y), which also gives the steps in the last-step-first order
+    #   dijkstra_path_walk pops them in
+    m = p.map
+    width = m.width
+    cur = x + y * width
+    if not (0 <= x < width and 0 <= y < m.height) or cur not in p.distances:
+        return False
+    steps = []
+    while p.distances[cur] > 0:
+        steps.append((cur % width, cur // width))
+        cx = cur % width
+        cy = cur // width
+        best = cur
+        for nx, ny in _NEIGHBOURS:
+            if not (0 <= cx + nx < width and 0 <= cy + ny < m.height):
+                continue
+            nxt = (cx + nx) + (cy + ny) * width
+            if p.distances.get(nxt, p.distances[best]) < p.distances[best]:
+                best = nxt
+        if best == cur:
+            break
+        cur = best
+    p.steps = steps
+    return True
+
+def dijkstra_size(p):
+    return len(p.steps)
+
+def dijkstra_get(p, idx):
+    return p.steps[len(p.steps) - 1 - idx]
+
+def dijkstra_is_empty(p):
+    return not p.steps
+
+def dijkstra_path_walk(p):
+    if p.steps:
+        return p.steps.pop()
+    return None,None
+
+def dijkstra_delete(p):
+    pass
@@ -39,25 +39,75 @@ try:  #import NumPy if available
 except ImportError:
     numpy_available = False
 
+# the library's functions are looked up lazily. setting restype and argtypes
+# on hundreds of functions (over a thousand on the Mac, see cprotos.py) made
+# importing this module slow, so they are only recorded here, and applied
+# when a function is first called
+class _LazyLibrary:
+    # wraps a ctypes library. getting a function that hasn't been called yet
+    # returns a _Binding for it
+    def __init__(self, library):
+        self.__dict__['_library'] = library
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        binding = _Binding(self, name)
+        setattr(self, name, binding)
+        return binding
+
+    def __setattr__(self, name, value):
+        # remember every name a binding is stored under (e.g. aliases to the
+        # _wrapper functions on Windows), so they can all be replaced by the
+        # real function
+        if isinstance(value, _Binding):
+            value.names.append(name)
+        self.__dict__[name] = value
+
+class _Binding:
+    # a function of the library that hasn't been looked up yet. restype and
+    # argtypes set on it are kept, and set on the real function once it is
+    # looked up, on the first call. from then on the library holds the real
+    # function, so calls cost the same as without the lazy lookup
+    def __init__(self, library, name):
+        self.library = library
+        self.name = name
+        self.names = []
+        self.function = None
+
+    def __call__(self, *args):
+        if self.function is None:
+            self.bind()
+        return self.function(*args)
+
+    def bind(self):
+        function = getattr(self.library._library, self.name)
+        for attribute in ('restype', 'argtypes', 'errcheck'):
+            if attribute in self.__dict__:
+                setattr(function, attribute, self.__dict__[attribute])
+        self.function = function
+        for name in self.names:
+            self.library.__dict__[name] = function
+
 LINUX=False
 MAC=False
 MINGW=False
 MSVC=False
 if sys.platform.find('linux') != -1:
-    _lib = ctypes.cdll['./libtcod.so']
+    _lib = _LazyLibrary(ctypes.cdll['./libtcod.so'])
     LINUX=True
 elif sys.platform.find('darwin') != -1:
-    _lib = ctypes.cdll['./libtcod.dylib']
+    _lib = _LazyLibrary(ctypes.cdll['./libtcod.dylib'])
     MAC = True
 elif sys.platform.find('haiku') != -1:
-    _lib = ctypes.cdll['./libtcod.so']
+    _lib = _LazyLibrary(ctypes.cdll['./libtcod.so'])
     HAIKU = True
 else:
     try:
-        _lib = ctypes.cdll['./libtcod-mingw.dll']
+        _lib = _LazyLibrary(ctypes.cdll['./libtcod-mingw.dll'])
         MINGW=True
     except WindowsError:
-        _lib = ctypes.cdll['./libtcod-VS.dll']
+        _lib = _LazyLibrary(ctypes.cdll['./libtcod-VS.dll'])
         MSVC=True
     # On Windows, ctypes doesn't work well with function returning structs,
     # so we have to user the _wrapper functions instead
@@ -134,227 +184,253 @@ _lib.TCOD_color_multiply_scalar.restype = Color
 _lib.TCOD_color_add.restype = Color
 _lib.TCOD_color_subtract.restype = Color
 
-# default colors
-# grey levels
-black=Color(0,0,0)
-darkest_grey=Color(31,31,31)
-darker_grey=Color(63,63,63)
-dark_grey=Color(95,95,95)
-grey=Color(127,127,127)
-light_grey=Color(159,159,159)
-lighter_grey=Color(191,191,191)
-lightest_grey=Color(223,223,223)
-darkest_gray=Color(31,31,31)
-darker_gray=Color(63,63,63)
-dark_gray=Color(95,95,95)
-gray=Color(127,127,127)
-light_gray=Color(159,159,159)
-lighter_gray=Color(191,191,191)
-lightest_gray=Color(223,223,223)
-white=Color(255,255,255)
-
-# sepia
-darkest_sepia=Color(31,24,15)
-darker_sepia=Color(63,50,31)
-dark_sepia=Color(94,75,47)
-sepia=Color(127,101,63)
-light_sepia=Color(158,134,100)
-lighter_sepia=Color(191,171,143)
-lightest_sepia=Color(222,211,195)
-
-#standard colors
-red=Color(255,0,0)
-flame=Color(255,63,0)
-orange=Color(255,127,0)
-amber=Color(255,191,0)
-yellow=Color(255,255,0)
-lime=Color(191,255,0)
-chartreuse=Color(127,255,0)
-green=Color(0,255,0)
-sea=Color(0,255,127)
-turquoise=Color(0,255,191)
-cyan=Color(0,255,255)
-sky=Color(0,191,255)
-azure=Color(0,127,255)
-blue=Color(0,0,255)
-han=Color(63,0,255)
-violet=Color(127,0,255)
-purple=Color(191,0,255)
-fuchsia=Color(255,0,255)
-magenta=Color(255,0,191)
-pink=Color(255,0,127)
-crimson=Color(255,0,63)
-
-# dark colors
-dark_red=Color(191,0,0)
-dark_flame=Color(191,47,0)
-dark_orange=Color(191,95,0)
-dark_amber=Color(191,143,0)
-dark_yellow=Color(191,191,0)
-dark_lime=Color(143,191,0)
-dark_chartreuse=Color(95,191,0)
-dark_green=Color(0,191,0)
-dark_sea=Color(0,191,95)
-dark_turquoise=Color(0,191,143)
-dark_cyan=Color(0,191,191)
-dark_sky=Color(0,143,191)
-dark_azure=Color(0,95,191)
-dark_blue=Color(0,0,191)
-dark_han=Color(47,0,191)
-dark_violet=Color(95,0,191)
-dark_purple=Color(143,0,191)
-dark_fuchsia=Color(191,0,191)
-dark_magenta=Color(191,0,143)
-dark_pink=Color(191,0,95)
-dark_crimson=Color(191,0,47)
-
-# darker colors
-darker_red=Color(127,0,0)
-darker_flame=Color(127,31,0)
-darker_orange=Color(127,63,0)
-darker_amber=Color(127,95,0)
-darker_yellow=Color(127,127,0)
-darker_lime=Color(95,127,0)
-darker_chartreuse=Color(63,127,0)
-darker_green=Color(0,127,0)
-darker_sea=Color(0,127,63)
-darker_turquoise=Color(0,127,95)
-darker_cyan=Color(0,127,127)
-darker_sky=Color(0,95,127)
-darker_azure=Color(0,63,127)
-darker_blue=Color(0,0,127)
-darker_han=Color(31,0,127)
-darker_violet=Color(63,0,127)
-darker_purple=Color(95,0,127)
-darker_fuchsia=Color(127,0,127)
-darker_magenta=Color(127,0,95)
-darker_pink=Color(127,0,63)
-darker_crimson=Color(127,0,31)
-
-# darkest colors
-darkest_red=Color(63,0,0)
-darkest_flame=Color(63,15,0)
-darkest_orange=Color(63,31,0)
-darkest_amber=Color(63,47,0)
-darkest_yellow=Color(63,63,0)
-darkest_lime=Color(47,63,0)
-darkest_chartreuse=Color(31,63,0)
-darkest_green=Color(0,63,0)
-darkest_sea=Color(0,63,31)
-darkest_turquoise=Color(0,63,47)
-darkest_cyan=Color(0,63,63)
-darkest_sky=Color(0,47,63)
-darkest_azure=Color(0,31,63)
-darkest_blue=Color(0,0,63)
-darkest_han=Color(15,0,63)
-darkest_violet=Color(31,0,63)
-darkest_purple=Color(47,0,63)
-darkest_fuchsia=Color(63,0,63)
-darkest_magenta=Color(63,0,47)
-darkest_pink=Color(63,0,31)
-darkest_crimson=Color(63,0,15)
-
-# light colors
-light_red=Color(255,114,114)
-light_flame=Color(255,149,114)
-light_orange=Color(255,184,114)
-light_amber=Color(255,219,114)
-light_yellow=Color(255,255,114)
-light_lime=Color(219,255,114)
-light_chartreuse=Color(184,255,114)
-light_green=Color(114,255,114)
-light_sea=Color(114,255,184)
-light_turquoise=Color(114,255,219)
-light_cyan=Color(114,255,255)
-light_sky=Color(114,219,255)
-light_azure=Color(114,184,255)
-light_blue=Color(114,114,255)
-light_han=Color(149,114,255)
-light_violet=Color(184,114,255)
-light_purple=Color(219,114,255)
-light_fuchsia=Color(255,114,255)
-light_magenta=Color(255,114,219)
-light_pink=Color(255,114,184)
-light_crimson=Color(255,114,149)
-
-#lighter colors
-lighter_red=Color(255,165,165)
-lighter_flame=Color(255,188,165)
-lighter_orange=Color(255,210,165)
-lighter_amber=Color(255,232,165)
-lighter_yellow=Color(255,255,165)
-lighter_lime=Color(232,255,165)
-lighter_chartreuse=Color(210,255,165)
-lighter_green=Color(165,255,165)
-lighter_sea=Color(165,255,210)
-lighter_turquoise=Color(165,255,232)
-lighter_cyan=Color(165,255,255)
-lighter_sky=Color(165,232,255)
-lighter_azure=Color(165,210,255)
-lighter_blue=Color(165,165,255)
-lighter_han=Color(188,165,255)
-lighter_violet=Color(210,165,255)
-lighter_purple=Color(232,165,255)
-lighter_fuchsia=Color(255,165,255)
-lighter_magenta=Color(255,165,232)
-lighter_pink=Color(255,165,210)
-lighter_crimson=Color(255,165,188)
-
-# lightest colors
-lightest_red=Color(255,191,191)
-lightest_flame=Color(255,207,191)
-lightest_orange=Color(255,223,191)
-lightest_amber=Color(255,239,191)
-lightest_yellow=Color(255,255,191)
-lightest_lime=Color(239,255,191)
-lightest_chartreuse=Color(223,255,191)
-lightest_green=Color(191,255,191)
-lightest_sea=Color(191,255,223)
-lightest_turquoise=Color(191,255,239)
-lightest_cyan=Color(191,255,255)
-lightest_sky=Color(191,239,255)
-lightest_azure=Color(191,223,255)
-lightest_blue=Color(191,191,255)
-lightest_han=Color(207,191,255)
-lightest_violet=Color(223,191,255)
-lightest_purple=Color(239,191,255)
-lightest_fuchsia=Color(255,191,255)
-lightest_magenta=Color(255,191,239)
-lightest_pink=Color(255,191,223)
-lightest_crimson=Color(255,191,207)
-
-# desaturated colors
-desaturated_red=Color(127,63,63)
-desaturated_flame=Color(127,79,63)
-desaturated_orange=Color(127,95,63)
-desaturated_amber=Color(127,111,63)
-desaturated_yellow=Color(127,127,63)
-desaturated_lime=Color(111,127,63)
-desaturated_chartreuse=Color(95,127,63)
-desaturated_green=Color(63,127,63)
-desaturated_sea=Color(63,127,95)
-desaturated_turquoise=Color(63,127,111)
-desaturated_cyan=Color(63,127,127)
-desaturated_sky=Color(63,111,127)
-desaturated_azure=Color(63,95,127)
-desaturated_blue=Color(63,63,127)
-desaturated_han=Color(79,63,127)
-desaturated_violet=Color(95,63,127)
-desaturated_purple=Color(111,63,127)
-desaturated_fuchsia=Color(127,63,127)
-desaturated_magenta=Color(127,63,111)
-desaturated_pink=Color(127,63,95)
-desaturated_crimson=Color(127,63,79)
-
-# metallic
-brass=Color(191,151,96)
-copper=Color(197,136,124)
-gold=Color(229,191,0)
-silver=Color(203,203,203)
-
-# miscellaneous
-celadon=Color(172,255,175)
-peach=Color(255,159,127)
+# default colors. they are only built when first used (see __getattr__
+# below), as a table of name: (r, g, b)
+_colors = {
+    # grey levels
+    'black': (0,0,0),
+    'darkest_grey': (31,31,31),
+    'darker_grey': (63,63,63),
+    'dark_grey': (95,95,95),
+    'grey': (127,127,127),
+    'light_grey': (159,159,159),
+    'lighter_grey': (191,191,191),
+    'lightest_grey': (223,223,223),
+    'darkest_gray': (31,31,31),
+    'darker_gray': (63,63,63),
+    'dark_gray': (95,95,95),
+    'gray': (127,127,127),
+    'light_gray': (159,159,159),
+    'lighter_gray': (191,191,191),
+    'lightest_gray': (223,223,223),
+    'white': (255,255,255),
+
+    # sepia
+    'darkest_sepia': (31,24,15),
+    'darker_sepia': (63,50,31),
+    'dark_sepia': (94,75,47),
+    'sepia': (127,101,63),
+    'light_sepia': (158,134,100),
+    'lighter_sepia': (191,171,143),
+    'lightest_sepia': (222,211,195),
+
+    #standard colors
+    'red': (255,0,0),
+    'flame': (255,63,0),
+    'orange': (255,127,0),
+    'amber': (255,191,0),
+    'yellow': (255,255,0),
+    'lime': (191,255,0),
+    'chartreuse': (127,255,0),
+    'green': (0,255,0),
+    'sea': (0,255,127),
+    'turquoise': (0,255,191),
+    'cyan': (0,255,255),
+    'sky': (0,191,255),
+    'azure': (0,127,255),
+    'blue': (0,0,255),
+    'han': (63,0,255),
+    'violet': (127,0,255),
+    'purple': (191,0,255),
+    'fuchsia': (255,0,255),
+    'magenta': (255,0,191),
+    'pink': (255,0,127),
+    'crimson': (255,0,63),
+
+    # dark colors
+    'dark_red': (191,0,0),
+    'dark_flame': (191,47,0),
+    'dark_orange': (191,95,0),
+    'dark_amber': (191,143,0),
+    'dark_yellow': (191,191,0),
+    'dark_lime': (143,191,0),
+    'dark_chartreuse': (95,191,0),
+    'dark_green': (0,191,0),
+    'dark_sea': (0,191,95),
+    'dark_turquoise': (0,191,143),
+    'dark_cyan': (0,191,191),
+    'dark_sky': (0,143,191),
+    'dark_azure': (0,95,191),
+    'dark_blue': (0,0,191),
+    'dark_han': (47,0,191),
+    'dark_violet': (95,0,191),
+    'dark_purple': (143,0,191),
+    'dark_fuchsia': (191,0,191),
+    'dark_magenta': (191,0,143),
+    'dark_pink': (191,0,95),
+    'dark_crimson': (191,0,47),
+
+    # darker colors
+    'darker_red': (127,0,0),
+    'darker_flame': (127,31,0),
+    'darker_orange': (127,63,0),
+    'darker_amber': (127,95,0),
+    'darker_yellow': (127,127,0),
+    'darker_lime': (95,127,0),
+    'darker_chartreuse': (63,127,0),
+    'darker_green': (0,127,0),
+    'darker_sea': (0,127,63),
+    'darker_turquoise': (0,127,95),
+    'darker_cyan': (0,127,127),
+    'darker_sky': (0,95,127),
+    'darker_azure': (0,63,127),
+    'darker_blue': (0,0,127),
+    'darker_han': (31,0,127),
+    'darker_violet': (63,0,127),
+    'darker_purple': (95,0,127),
+    'darker_fuchsia': (127,0,127),
+    'darker_magenta': (127,0,95),
+    'darker_pink': (127,0,63),
+    'darker_crimson': (127,0,31),
+
+    # darkest colors
+    'darkest_red': (63,0,0),
+    'darkest_flame': (63,15,0),
+    'darkest_orange': (63,31,0),
+    'darkest_amber': (63,47,0),
+    'darkest_yellow': (63,63,0),
+    'darkest_lime': (47,63,0),
+    'darkest_chartreuse': (31,63,0),
+    'darkest_green': (0,63,0),
+    'darkest_sea': (0,63,31),
+    'darkest_turquoise': (0,63,47),
+    'darkest_cyan': (0,63,63),
+    'darkest_sky': (0,47,63),
+    'darkest_azure': (0,31,63),
+    'darkest_blue': (0,0,63),
+    'darkest_han': (15,0,63),
+    'darkest_violet': (31,0,63),
+    'darkest_purple': (47,0,63),
+    'darkest_fuchsia': (63,0,63),
+    'darkest_magenta': (63,0,47),
+    'darkest_pink': (63,0,31),
+    'darkest_crimson': (63,0,15),
+
+    # light colors
+    'light_red': (255,114,114),
+    'light_flame': (255,149,114),
+    'light_orange': (255,184,114),
+    'light_amber': (255,219,114),
+    'light_yellow': (255,255,114),
+    'light_lime': (219,255,114),
+    'light_chartreuse': (184,255,114),
+    'light_green': (114,255,114),
+    'light_sea': (114,255,184),
+    'light_turquoise': (114,255,219),
+    'light_cyan': (114,255,255),
+    'light_sky': (114,219,255),
+    'light_azure': (114,184,255),
+    'light_blue': (114,114,255),
+    'light_han': (149,114,255),
+    'light_violet': (184,114,255),
+    'light_purple': (219,114,255),
+    'light_fuchsia': (255,114,255),
+    'light_magenta': (255,114,219),
+    'light_pink': (255,114,184),
+    'light_crimson': (255,114,149),
+
+    #lighter colors
+    'lighter_red': (255,165,165),
+    'lighter_flame': (255,188,165),
+    'lighter_orange': (255,210,165),
+    'lighter_amber': (255,232,165),
+    'lighter_yellow': (255,255,165),
+    'lighter_lime': (232,255,165),
+    'lighter_chartreuse': (210,255,165),
+    'lighter_green': (165,255,165),
+    'lighter_sea': (165,255,210),
+    'lighter_turquoise': (165,255,232),
+    'lighter_cyan': (165,255,255),
+    'lighter_sky': (165,232,255),
+    'lighter_azure': (165,210,255),
+    'lighter_blue': (165,165,255),
+    'lighter_han': (188,165,255),
+    'lighter_violet': (210,165,255),
+    'lighter_purple': (232,165,255),
+    'lighter_fuchsia': (255,165,255),
+    'lighter_magenta': (255,165,232),
+    'lighter_pink': (255,165,210),
+    'lighter_crimson': (255,165,188),
+
+    # lightest colors
+    'lightest_red': (255,191,191),
+    'lightest_flame': (255,207,191),
+    'lightest_orange': (255,223,191),
+    'lightest_amber': (255,239,191),
+    'lightest_yellow': (255,255,191),
+    'lightest_lime': (239,255,191),
+    'lightest_chartreuse': (223,255,191),
+    'lightest_green': (191,255,191),
+    'lightest_sea': (191,255,223),
+    'lightest_turquoise': (191,255,239),
+    'lightest_cyan': (191,255,255),
+    'lightest_sky': (191,239,255),
+    'lightest_azure': (191,223,255),
+    'lightest_blue': (191,191,255),
+    'lightest_han': (207,191,255),
+    'lightest_violet': (223,191,255),
+    'lightest_purple': (239,191,255),
+    'lightest_fuchsia': (255,191,255),
+    'lightest_magenta': (255,191,239),
+    'lightest_pink': (255,191,223),
+    'lightest_crimson': (255,191,207),
+
+    # desaturated colors
+    'desaturated_red': (127,63,63),
+    'desaturated_flame': (127,79,63),
+    'desaturated_orange': (127,95,63),
+    'desaturated_amber': (127,111,63),
+    'desaturated_yellow': (127,127,63),
+    'desaturated_lime': (111,127,63),
+    'desaturated_chartreuse': (95,127,63),
+    'desaturated_green': (63,127,63),
+    'desaturated_sea': (63,127,95),
+    'desaturated_turquoise': (63,127,111),
+    'desaturated_cyan': (63,127,127),
+    'desaturated_sky': (63,111,127),
+    'desaturated_azure': (63,95,127),
+    'desaturated_blue': (63,63,127),
+    'desaturated_han': (79,63,127),
+    'desaturated_violet': (95,63,127),
+    'desaturated_purple': (111,63,127),
+    'desaturated_fuchsia': (127,63,127),
+    'desaturated_magenta': (127,63,111),
+    'desaturated_pink': (127,63,95),
+    'desaturated_crimson': (127,63,79),
+
+    # metallic
+    'brass': (191,151,96),
+    'copper': (197,136,124),
+    'gold': (229,191,0),
+    'silver': (203,203,203),
+
+    # miscellaneous
+    'celadon': (172,255,175),
+    'peach': (255,159,127),
+}
+
+def _color(name):
+    # build a named color and keep it as a module global, so this only
+    # happens once per color
+    color = Color(*_colors[name])
+    globals()[name] = color
+    return color
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # called for module attributes that don't exist (yet)
+        if name in _colors:
+            return _color(name)
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()) | set(_colors))
+else:
+    # older Pythons can't look up module attributes lazily
+    for _name in _colors:
+        _color(_name)
+
 
 # color functions
 _lib.TCOD_color_lerp.restype = Color
@@ -1542,6 +1618,56 @@ def map_compute_fov(m, x, y, radius=0, light_walls=True, algo=FOV_RESTRICTIVE ):
 def map_is_in_fov(m, x, y):
     return _lib.TCOD_map_is_in_fov(m, x, y)
 
+# the start of libtcod's map_t. each cell is a byte of flags, row by row
+class _MapData(Structure):
+    _fields_ = [('width', c_int),
+                ('height', c_int),
+                ('nbcells', c_int),
+                ('cells', POINTER(c_uint8))]
+
+_MAP_TRANSPARENT = 1
+_MAP_WALKABLE = 2
+_MAP_FOV = 4
+# turns a cell's flags into 1 if it's in the FOV, 0 otherwise
+_fov_flags = bytes(bytearray((i & _MAP_FOV) >> 2 for i in range(256)))
+
+def _map_data(m):
+    return cast(c_void_p(m), POINTER(_MapData)).contents
+
+def map_fov_array(m):
+    # the FOV last computed on a map, for every cell at once: a NumPy bool
+    # array indexed [x, y] (a bytearray of 0 and 1, row by row, without
+    # NumPy). the cells are copied in one go, instead of calling
+    # map_is_in_fov for each of them
+    data = _map_data(m)
+    cells = string_at(data.cells, data.nbcells)
+    if numpy_available:
+        flags = numpy.frombuffer(cells, dtype=numpy.uint8)
+        return ((flags & _MAP_FOV) != 0).reshape((data.width, data.height),
+                                                 order='F')
+    return bytearray(cells.translate(_fov_flags))
+
+def map_set_arrays(m, transparent, walkable):
+    # set the transparency and walkability of every cell of a map at once,
+    # from NumPy arrays indexed [x, y], or from sequences of the cells row by
+    # row (e.g. array.array('B')). the cells are written in one go, instead
+    # of calling map_set_properties for each of them, and the FOV is cleared
+    # like map_clear does
+    data = _map_data(m)
+    if numpy_available:
+        transparent = numpy.ravel(transparent, order='F') != 0
+        walkable = numpy.ravel(walkable, order='F') != 0
+        if len(transparent) != data.nbcells or len(walkable) != data.nbcells:
+            raise ValueError('expected %d cells' % data.nbcells)
+        cells = (transparent * _MAP_TRANSPARENT |
+                 walkable * _MAP_WALKABLE).astype(numpy.uint8).tobytes()
+    else:
+        if len(transparent) != data.nbcells or len(walkable) != data.nbcells:
+            raise ValueError('expected %d cells' % data.nbcells)
+        cells = bytes(bytearray((t and _MAP_TRANSPARENT) | (w and _MAP_WALKABLE)
+                                for (t, w) in zip(transparent, walkable)))
+    memmove(data.cells, cells, data.nbcells)
+
 def map_is_transparent(m, x, y):
     return _lib.TCOD_map_is_transparent(m, x, y)
 
@@ -1,13 +1,25 @@
-import libtcodpy as libtcod
+import collections
+import heapq
 import math
+import numpy
+import os
 import textwrap
-import shelve
+import threading
+import time
+
+import savefile
+
+# LOVECRAFTRL_BACKEND=headless runs the game without libtcod or a window (see
+#   libtcodheadless.py), e.g. for simulations and profiling
+if os.environ.get('LOVECRAFTRL_BACKEND') == 'headless':
+    import libtcodheadless as libtcod
+else:
+    import libtcodpy as libtcod
 
 # Last change: Reworked random monster/item selection
 
 # TODO: 
 #       add more variation to types of rooms (check out Crawl's vaults)
-#       modify FOV to support light sources other than the player
 #       modify place_objects to support squads, fit theme, etc (EXP based?)
 #       organize into 'gameloop.py', 'functions.py', 'classes.py', etc.
 #           files
@@ -17,7 +29,6 @@ import shelve
 #       rework items to be theme-appropriate
 #       add mouse support to menus (low priority)
 #       organize inventory by item type
-#       add support for multiple saves
 #       figure out how to get '>' and '<' keys working for stairs
 #       rework item randomization
 #       adjust messages to have better grammar
@@ -42,6 +53,7 @@ MSG_HEIGHT = PANEL_HEIGHT - 1
 INVENTORY_WIDTH = 50
 LEVEL_SCREEN_WIDTH = 40
 CHARACTER_SCREEN_WIDTH = 30
+SLOT_MENU_WIDTH = 60
 
 # parameters for map creation
 MAP_WIDTH = 80
@@ -51,11 +63,37 @@ MAP_HEIGHT = 43
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
 MAX_ROOMS = 30
+MAX_FLOOR_SEED = 0x7fffffff
 
 # parameters for FOV
 FOV_ALGO = 0 # default FOV algorithm
 FOV_LIGHT_WALLS = True
 TORCH_RADIUS = 10
+# how many computed FOVs are kept for the current floor (see FovCache)
+FOV_CACHE_SIZE = 256
+# precompute the torch FOV from every tile of a floor in the background
+#   (see VisibilityTable). the worker and the game take turns computing FOVs
+#   (see compute_map_fov). the headless backend computes FOVs in Python, so
+#   there a worker thread would only compete with the game for the
+#   interpreter
+PRECOMPUTE_FOV = not getattr(libtcod, 'HEADLESS', False)
+
+# parameters for lights other than the player's torch (see LightMap). light
+#   is measured in whole numbers, LIGHT_FULL being as bright as the torch
+LIGHT_FULL = 100
+LIGHT_STEPS = 4 # how many shades of dim light tiles are drawn in
+BRAZIER_RADIUS = 6
+BRAZIER_INTENSITY = 80
+
+# parameters for monster AI
+MAX_CHASE_DISTANCE = 25 # monsters farther away than this don't find a path
+WAKE_RADIUS = 4 # sleeping monsters this close to the player wake up
+NOISE_RADIUS = 8 # how far away the noise of a fight wakes monsters up
+ALERT_TURNS = 10 # turns an awake monster hunts the player out of sight
+SIGHT_RADIUS = TORCH_RADIUS # how far monsters see (see MonsterVision)
+
+# parameters for rendering
+MAX_DIRTY_TILES = 200 # above this many changed tiles, redraw the whole map
 
 # parameters for items
 HEAL_AMOUNT = 40
@@ -66,6 +104,62 @@ CONFUSE_RANGE = 8
 FIREBALL_DAMAGE = 25
 FIREBALL_RADIUS = 3
 
+# saved game directory and the database of saved games in it, see
+#   savefile.py for the format. every game is saved in one of SAVE_SLOTS
+#   slots, and its journals (see start_journal) go in a directory of the slot
+SAVE_DIR = 'saves'
+SAVE_FILE = os.path.join(SAVE_DIR, 'saves.db')
+SAVE_SLOTS = 3
+JOURNAL_DIR = os.path.join(SAVE_DIR, 'journal-%d')
+
+# the game is saved in the background every this many turns
+AUTOSAVE_INTERVAL = 100
+
+# how many visited floors are kept in memory. the others are spilled to
+#   FLOOR_CACHE_DIR until the player comes back to them
+FLOOR_CACHE_SIZE = 4
+FLOOR_CACHE_DIR = os.path.join(SAVE_DIR, 'cache')
+
+# record tables of the save file. objects refer to their components, and
+#   components (and objects) to strings, by index
+OBJECT_RECORDS = [
+    # x, y, char, name, color (r, g, b), flags (blocks, always_visible),
+    #   fighter, ai, item, equipment, light
+    ('object', '<hhiiBBBBiiiii'),
+    # base_max_hp, hp, base_defense, base_power, xp, death_function,
+    #   move_delay, attack_delay
+    ('fighter', '<iiiiiidd'),
+    # type, awake, alert, num_turns, old_ai
+    ('ai', '<BBhhi'),
+    # use_function
+    ('item', '<i'),
+    # slot, is_equipped, power_bonus, defense_bonus, max_hp_bonus
+    ('equipment', '<iBiii'),
+    # radius, intensity
+    ('light', '<hh')]
+GAME_RECORDS = [
+    # dungeon_level, turn_counter, game_state, player (object), player level,
+    #   number of floors, journal (serial of the journal started with the
+    #   save)
+    ('game', '<iiiiiii'),
+    # object
+    ('inventory', '<i'),
+    # text, color (r, g, b)
+    ('message', '<iBBB')]
+FLOOR_RECORDS = [
+    # seed the floor is generated from
+    ('floor', '<I'),
+    # one per object on the floor, in drawing order: generated (index in the
+    #   floor's generated objects, -1 if it wasn't generated, -2 for the
+    #   player, who is saved with the game), object (-1 if the object is just
+    #   as it was generated)
+    ('order', '<ii'),
+    # x, y, blocked, block_sight of the tiles changed after generation
+    ('tile', '<hhBB'),
+    # the actors waiting for their turn when the floor was left: object
+    #   (position in the objects' order), time of its next turn
+    ('schedule', '<id')]
+
 # experience and level-ups
 LEVEL_UP_BASE = 200
 LEVEL_UP_FACTOR = 150
@@ -76,10 +170,55 @@ color_light_wall = libtcod.light_grey
 color_dark_floor = libtcod.grey
 color_light_floor = libtcod.white
 
+# character, foreground and background for every way a map tile can look,
+#   indexed by the TILE_* constants below
+TILE_UNEXPLORED = 0
+TILE_DARK_WALL = 1
+TILE_DARK_FLOOR = 2
+TILE_LIGHT_WALL = 3
+TILE_LIGHT_FLOOR = 4
+tile_looks = [(' ', libtcod.black, libtcod.black),
+              ('#', color_dark_wall, color_dark_wall),
+              ('.', color_dark_floor, libtcod.black),
+              ('#', color_light_wall, color_light_wall),
+              ('.', color_light_floor, libtcod.black)]
+# tiles only lit by lights other than the torch are drawn in one of
+#   LIGHT_STEPS shades between dark and lit, the dimmest first. the wall of
+#   shade s looks like TILE_DIM_WALL + 2 * s, and the floor right after it
+TILE_DIM_WALL = 5
+for step in range(LIGHT_STEPS):
+    amount = (step + 1.0) / (LIGHT_STEPS + 1)
+    for (dark, lit) in [(TILE_DARK_WALL, TILE_LIGHT_WALL),
+                        (TILE_DARK_FLOOR, TILE_LIGHT_FLOOR)]:
+        (char, dark_fore, dark_back) = tile_looks[dark]
+        (char, lit_fore, lit_back) = tile_looks[lit]
+        tile_looks.append((char,
+            libtcod.Color(*[int(d + (l - d) * amount)
+                            for (d, l) in zip(dark_fore, lit_fore)]),
+            libtcod.Color(*[int(d + (l - d) * amount)
+                            for (d, l) in zip(dark_back, lit_back)])))
+# the same looks as arrays. colors are stored as rows of red, green and blue
+#   so render_all can hand them straight to the console_fill_* functions
+tile_chars = numpy.array([ord(char) for (char, fore, back) in tile_looks],
+                         dtype = numpy.int32)
+tile_fore = numpy.array([list(fore) for (char, fore, back) in tile_looks],
+                        dtype = numpy.int32).T.copy()
+tile_back = numpy.array([list(back) for (char, fore, back) in tile_looks],
+                        dtype = numpy.int32).T.copy()
+
+# the eight directions a monster can step in
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0),
+              (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
 # player move and attack delays
 PLAYER_MOVE_DELAY = 1
 PLAYER_ATTACK_DELAY = 1
 
+# default monster move and attack delays. a monster with a delay of 0.5 acts
+#   twice for every step of the player, one with a delay of 2 every other step
+MONSTER_MOVE_DELAY = 1
+MONSTER_ATTACK_DELAY = 1
+
 
 
 #########################
@@ -90,7 +229,7 @@ class Object:
     # always represented by character on screen
     def __init__(self, x, y, char, name, color, blocks = False, 
                 always_visible = False, fighter = None, ai = None, 
-                item = None, equipment = None):
+                item = None, equipment = None, light = None):
         self.name = name
         self.blocks = blocks
         self.x = x
@@ -122,77 +261,57 @@ class Object:
             self.item = Item()
             self.item.owner = self
 
+        self.light = light
+        if self.light:
+            # Let the light know who owns it
+            self.light.owner = self
+
     def move(self, dx, dy):
         # move by given amount
         if not is_blocked(self.x + dx, self.y + dy):
-            self.x += dx
-            self.y += dy
-    
-    def move_astar(self, target):
-        # create a fov map that has the dimensions of the map
-        fov = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
+            self.set_position(self.x + dx, self.y + dy)
 
-        # scan the current map each turn and set all walls as unwalkable
-        for y1 in range(MAP_HEIGHT):
-            for x1 in range(MAP_WIDTH):
-                libtcod.map_set_properties(fov, x1, y1,
-                                           not map[x1][y1].block_sight,
-                                           not map[x1][y1].blocked)
-        # scan all objects to see if there are objects that must be navigated
-        #   around. Also check that the object isn't self or the target (so that
-        #   the start and end points are free). The AI class handles the
-        #   situation if self is next to the target, not this function.
-        for obj in objects:
-            if obj.blocks and obj != self and obj != target:
-                # set the tile as a wall so it must be navigated around
-                libtcod.map_set_properties(fov, obj.x, obj.y, True, False)
-
-        # allocate an A* path. The 1.41 is the normal diagonal cost of moving,
-        #   it can be set as 0.0 if diagonal moves are prohibited
-        my_path = libtcod.path_new_using_map(fov, 1.41)
-
-        # compute the path between self's coordinates and target's coordinates
-        libtcod.path_compute(my_path, self.x, self.y, target.x, target.y)
-
-        # check if the path exists, and in this case, also the path is shorter
-        #   than 25 tiles. The path size matters if you want the monster to use
-        #   alternate longer paths (e.g. through other rooms). It makes sense to
-        #   keep the path size relatively low to keep the monsters from running
-        #   all over the map if there's an alternate path far away
-        if (not libtcod.path_is_empty(my_path) and
-            libtcod.path_size(my_path) < 25):
-            # find the next coordinates in the computed full path
-            x, y = libtcod.path_walk(my_path, True)
-            if x or y:
-                # set self's coordinates to the next path tile
-                self.x = x
-                self.y = y
+    def set_position(self, x, y):
+        # put the object at (x, y), keeping the object index up to date
+        object_index.move(self, x, y)
+        self.x = x
+        self.y = y
+    
+    def move_chase(self):
+        # step towards the player by going downhill on the shared chase map:
+        #   onto the free neighbouring tile that is closest to the player
+        update_chase_map()
+        best = None
+        best_dist = libtcod.dijkstra_get_distance(chase_map, self.x, self.y)
+        if 0 <= best_dist < MAX_CHASE_DISTANCE:
+            for (dx, dy) in DIRECTIONS:
+                (x, y) = (self.x + dx, self.y + dy)
+                if not (0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT):
+                    continue
+                dist = libtcod.dijkstra_get_distance(chase_map, x, y)
+                if 0 <= dist < best_dist and not is_blocked(x, y):
+                    best = (x, y)
+                    best_dist = dist
+
+        if best is None:
+            # no free tile gets closer (e.g. another monster is in the way,
+            #   or there's no path), so just try to move towards the player
+            self.move_towards(player.x, player.y)
         else:
-            # keep the old move function as a backup so that if there are no
-            #   paths (e.g. a monster blocking a corridor) it will still try to
-            #   move towards the player
-            self.move_towards(target.x, target.y)
+            self.set_position(best[0], best[1])
 
-        # delete the path to free memory
-        libtcod.path_delete(my_path)
+    def is_visible(self):
+        # objects show up when they're in the player's FOV. always visible ones
+        #   (stairs, items) also show up anywhere that has been explored
+        return (visible_tiles[self.x, self.y] or
+                (self.always_visible and map.explored[self.x, self.y]))
 
     def draw(self):
         # set color and then draw the character that represents this object at
         #   its position
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or
-            (self.always_visible and map[self.x][self.y].explored)):
-            libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char,
-                                     libtcod.BKGND_NONE)
-
-    def clear(self):
-        # erase the character that represents this object
-        if libtcod.map_is_in_fov(fov_map, self.x, self.y):
-            libtcod.console_put_char_ex(con, self.x, self.y, '.',
-                color_light_floor, libtcod.black)
-        else:
-            libtcod.console_put_char_ex(con, self.x, self.y, '.',
-                color_dark_floor, libtcod.black)
+        libtcod.console_set_default_foreground(con, self.color)
+        libtcod.console_put_char(con, self.x, self.y, self.char,
+                                 libtcod.BKGND_NONE)
 
     def move_towards(self, target_x, target_y):
         # draw vector from this object to the target
@@ -220,18 +339,542 @@ class Object:
         global objects
         objects.remove(self)
         objects.insert(0, self)
+        object_index.send_to_back(self)
 
 
 
-class Tile:
-    # a tile of the map and its properties
-    def __init__(self, blocked, block_sight = None):
-        self.blocked = blocked
-        self.explored = False
+class TileMap(object):
+    # the tiles of a floor. each tile property is kept in its own numpy array,
+    #   indexed [x, y] like the rest of the game. the arrays are in Fortran
+    #   order, so a row of the map is contiguous in memory (just like
+    #   libtcod's own maps and consoles)
+    def __init__(self, width, height, blocked = True, block_sight = None):
+        self.width = width
+        self.height = height
 
         # by default, if a tile is blocked, it also blocks sight
         if block_sight is None: block_sight = blocked
-        self.block_sight = block_sight
+        self.blocked = numpy.full((width, height), blocked, dtype = bool,
+                                  order = 'F')
+        self.block_sight = numpy.full((width, height), block_sight,
+                                      dtype = bool, order = 'F')
+        self.explored = numpy.zeros((width, height), dtype = bool, order = 'F')
+
+        # tiles changed after the map was generated, as (x, y): (blocked,
+        #   block_sight), and how many times that happened since the map was
+        #   set up, so FOVs computed before can be told apart. whatever
+        #   changes the terrain has to update both, and the light map (see
+        #   LightMap.terrain_changed)
+        self.edits = {}
+        self.revision = 0
+
+    def __len__(self):
+        return self.width
+
+    def __getitem__(self, x):
+        # keep map[x][y].blocked and friends working for older code. prefer
+        #   indexing the arrays directly (map.blocked[x, y]) in hot paths
+        return TileColumn(self, x)
+
+    def dig(self, x1, y1, x2, y2):
+        # make every tile in the rectangle [x1, x2) x [y1, y2) passable
+        self.blocked[x1:x2, y1:y2] = False
+        self.block_sight[x1:x2, y1:y2] = False
+
+
+
+class FovCache:
+    # the FOVs computed on the current floor, keyed by (x, y, radius, map
+    #   revision), so standing on a tile again doesn't compute its FOV again.
+    #   only the square around (x, y) that the radius can reach is kept, as
+    #   bits, for the size most recently used FOVs
+    def __init__(self, size = FOV_CACHE_SIZE):
+        self.size = size
+        # key -> (square, bits), least recently used first
+        self.masks = collections.OrderedDict()
+
+    def get(self, key):
+        # return the FOV stored for key as a boolean array, or None
+        if key not in self.masks:
+            return None
+        mask = self.masks.pop(key)
+        self.masks[key] = mask
+        return unpack_fov(mask)
+
+    def put(self, key, visible):
+        (x, y, radius, revision) = key
+        self.masks.pop(key, None)
+        self.masks[key] = pack_fov(visible, x, y, radius)
+        while len(self.masks) > self.size:
+            self.masks.popitem(last = False)
+
+
+
+class VisibilityTable:
+    # the FOV within radius from every walkable tile of a floor, computed on
+    #   a worker thread right after the floor is set up, since the terrain
+    #   doesn't change after generation. the worker starts with the tiles
+    #   closest to the player. get returns None for tiles it hasn't got to
+    #   yet, and for every tile once the terrain changes, and the FOV is then
+    #   computed as usual
+    def __init__(self, tilemap, radius, start):
+        self.radius = radius
+        self.revision = tilemap.revision
+        # (x, y) -> (square, bits), see pack_fov
+        self.masks = {}
+        self.stopped = threading.Event()
+        # the worker has its own copy of the terrain and its own FOV map
+        self.thread = threading.Thread(target = self.run,
+                                       args = (~tilemap.block_sight,
+                                               ~tilemap.blocked, start))
+        # don't keep the game running just to finish it
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, transparent, walkable, start):
+        fov = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
+        libtcod.map_set_arrays(fov, transparent, walkable)
+        (start_x, start_y) = start
+        (xs, ys) = numpy.nonzero(walkable)
+        tiles = sorted(zip(xs.tolist(), ys.tolist()),
+                       key = lambda tile: (tile[0] - start_x) ** 2 +
+                                          (tile[1] - start_y) ** 2)
+        for (x, y) in tiles:
+            if self.stopped.is_set():
+                break
+            self.masks[(x, y)] = pack_fov(compute_map_fov(fov, x, y,
+                                                          self.radius),
+                                          x, y, self.radius)
+        libtcod.map_delete(fov)
+
+    def stop(self):
+        # have the worker give up (e.g. the player left the floor). it
+        #   stops after the FOV it's computing, so this doesn't wait long
+        self.stopped.set()
+        self.thread.join()
+
+    def get(self, x, y):
+        # return the FOV from (x, y) as a boolean array, or None
+        if self.revision != map.revision:
+            return None
+        mask = self.masks.get((x, y))
+        if mask is None:
+            return None
+        return unpack_fov(mask)
+
+
+
+class LightMap:
+    # how much light falls on every tile of the current floor from the
+    #   lights on it (objects with a Light), not counting the player's torch.
+    #   each light's contribution is kept, so update only recomputes the
+    #   lights that moved or changed, or whose area has a tile whose terrain
+    #   changed; the rest stay as they were
+    def __init__(self):
+        self.levels = numpy.zeros((MAP_WIDTH, MAP_HEIGHT), dtype = numpy.int32,
+                                  order = 'F')
+        # obj -> (x, y, radius, intensity, square, contribution), the
+        #   contribution being the light it adds to every tile of square
+        self.lights = {}
+        # tiles changed since the last update
+        self.changed = []
+
+    def terrain_changed(self, x, y):
+        self.changed.append((x, y))
+
+    def update(self, objects):
+        # bring the light levels up to date with the lights among objects.
+        #   returns whether any of them changed
+        sources = {}
+        for obj in objects:
+            if obj.light and obj.light.intensity > 0:
+                sources[obj] = (obj.x, obj.y, obj.light.radius,
+                                obj.light.intensity)
+
+        updated = False
+        for (obj, lit) in list(self.lights.items()):
+            if sources.get(obj) != lit[:4] or self.overlaps_changes(lit[4]):
+                ((x1, y1, x2, y2), contribution) = lit[4:]
+                self.levels[x1:x2, y1:y2] -= contribution
+                del self.lights[obj]
+                updated = True
+        for (obj, source) in sources.items():
+            if obj not in self.lights:
+                self.add(obj, source)
+                updated = True
+        self.changed = []
+        return updated
+
+    def overlaps_changes(self, square):
+        (x1, y1, x2, y2) = square
+        for (x, y) in self.changed:
+            if x1 <= x < x2 and y1 <= y < y2:
+                return True
+        return False
+
+    def add(self, obj, source):
+        # light fades with distance, down to nothing just past the radius,
+        #   and only reaches the tiles that can be seen from the light
+        (x, y, radius, intensity) = source
+        (x1, y1) = (max(x - radius, 0), max(y - radius, 0))
+        (x2, y2) = (min(x + radius + 1, MAP_WIDTH),
+                    min(y + radius + 1, MAP_HEIGHT))
+        dx = numpy.arange(x1 - x, x2 - x)[:, numpy.newaxis]
+        dy = numpy.arange(y1 - y, y2 - y)[numpy.newaxis, :]
+        distance = numpy.sqrt(dx ** 2 + dy ** 2)
+        brightness = numpy.rint(intensity * (1 - distance / (radius + 1)))
+        seen = field_of_view(x, y, radius)[x1:x2, y1:y2] & (distance <= radius)
+        contribution = numpy.where(seen, brightness, 0).astype(numpy.int32)
+        self.levels[x1:x2, y1:y2] += contribution
+        self.lights[obj] = source + ((x1, y1, x2, y2), contribution)
+
+
+
+class MonsterVision:
+    # what the monsters on the current floor can see, within radius. the
+    #   FOVs of the monsters about to act are computed together (see update)
+    #   and kept as rows of bits, one row per origin, stacked in one array:
+    #   each row is the square of side 2 * radius + 1 around the origin. a
+    #   FOV is reused until its origin is left or the terrain changes, and
+    #   monsters standing where another one looked from share its FOV
+    def __init__(self, radius):
+        self.radius = radius
+        self.side = 2 * radius + 1
+        self.revision = map.revision
+        # (x, y) -> row of the origin's FOV in stack
+        self.rows = {}
+        self.stack = numpy.zeros((0, (self.side ** 2 + 7) // 8),
+                                 dtype = numpy.uint8)
+
+    def update(self, origins):
+        # have the FOVs from every (x, y) in origins ready, computing the
+        #   ones that aren't known yet, and forget every other origin's
+        self.check_revision()
+        origins = sorted(set(origins))
+        kept = [origin for origin in origins if origin in self.rows]
+        new = [origin for origin in origins if origin not in self.rows]
+        rows = [self.stack[[self.rows[origin] for origin in kept]]]
+        rows.extend(self.compute(x, y) for (x, y) in new)
+        self.stack = numpy.vstack(rows)
+        self.rows = dict((origin, i) for (i, origin) in enumerate(kept + new))
+
+    def can_see(self, obj, x, y):
+        # whether obj sees the tile (x, y). the FOV from obj's position is
+        #   computed if update didn't (e.g. it moved since)
+        (dx, dy) = (x - obj.x, y - obj.y)
+        if dx ** 2 + dy ** 2 > self.radius ** 2:
+            return False
+        self.check_revision()
+        row = self.rows.get((obj.x, obj.y))
+        if row is None:
+            row = len(self.stack)
+            self.stack = numpy.vstack([self.stack,
+                                       self.compute(obj.x, obj.y)])
+            self.rows[(obj.x, obj.y)] = row
+        bit = (dx + self.radius) * self.side + dy + self.radius
+        return bool(self.stack[row, bit >> 3] & (0x80 >> (bit & 7)))
+
+    def check_revision(self):
+        # every FOV is out of date once the terrain changes
+        if self.revision != map.revision:
+            self.revision = map.revision
+            self.rows = {}
+            self.stack = self.stack[:0]
+
+    def compute(self, x, y):
+        # the FOV from (x, y) as a row of stack. fov_map is only used as
+        #   scratch space, see compute_fov
+        visible = compute_map_fov(fov_map, x, y, self.radius)
+        r = self.radius
+        (x1, y1) = (max(x - r, 0), max(y - r, 0))
+        (x2, y2) = (min(x + r + 1, MAP_WIDTH), min(y + r + 1, MAP_HEIGHT))
+        square = numpy.zeros((self.side, self.side), dtype = bool)
+        square[x1 - x + r:x2 - x + r,
+               y1 - y + r:y2 - y + r] = visible[x1:x2, y1:y2]
+        return numpy.packbits(square.ravel())[numpy.newaxis, :]
+
+
+
+class TileColumn(object):
+    # a column of a TileMap, returned by map[x]
+    __slots__ = ('tilemap', 'x')
+
+    def __init__(self, tilemap, x):
+        self.tilemap = tilemap
+        self.x = x
+
+    def __len__(self):
+        return self.tilemap.height
+
+    def __getitem__(self, y):
+        return Tile(self.tilemap, self.x, y)
+
+
+
+class Tile(object):
+    # a view of a single tile of a TileMap. reading or writing its properties
+    #   goes straight to the map's arrays
+    __slots__ = ('tilemap', 'x', 'y')
+
+    def __init__(self, tilemap, x, y):
+        self.tilemap = tilemap
+        self.x = x
+        self.y = y
+
+    @property
+    def blocked(self):
+        return bool(self.tilemap.blocked[self.x, self.y])
+
+    @blocked.setter
+    def blocked(self, value):
+        self.tilemap.blocked[self.x, self.y] = value
+
+    @property
+    def block_sight(self):
+        return bool(self.tilemap.block_sight[self.x, self.y])
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.tilemap.block_sight[self.x, self.y] = value
+
+    @property
+    def explored(self):
+        return bool(self.tilemap.explored[self.x, self.y])
+
+    @explored.setter
+    def explored(self, value):
+        self.tilemap.explored[self.x, self.y] = value
+
+
+
+class SpatialIndex:
+    # the objects on a floor, sorted into square buckets of the map. looking
+    #   up what is at a tile, near a point or inside a rectangle only has to
+    #   check the objects in the buckets it covers instead of every object on
+    #   the floor
+    def __init__(self, bucket_size = 8):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        # obj -> rank, ordering the objects like the objects list (the
+        #   drawing order). lookups return objects sorted by rank, so they
+        #   come out in the same order however the index was built up, e.g.
+        #   when a loaded game replays its journal
+        self.ranks = {}
+        self.first = 0
+        self.last = 0
+
+    def bucket(self, x, y):
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def add(self, obj, to_back = False):
+        # add an object at the end of the drawing order, or at the back
+        if to_back:
+            self.first -= 1
+            self.ranks[obj] = self.first
+        else:
+            self.last += 1
+            self.ranks[obj] = self.last
+        self.buckets.setdefault(self.bucket(obj.x, obj.y), []).append(obj)
+
+    def remove(self, obj):
+        self.take_out(obj)
+        del self.ranks[obj]
+
+    def take_out(self, obj):
+        # take an object out of its bucket
+        key = self.bucket(obj.x, obj.y)
+        bucket = self.buckets[key]
+        bucket.remove(obj)
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, obj, x, y):
+        # call this before the object's coordinates change to (x, y)
+        if self.bucket(obj.x, obj.y) != self.bucket(x, y):
+            self.take_out(obj)
+            self.buckets.setdefault(self.bucket(x, y), []).append(obj)
+
+    def send_to_back(self, obj):
+        # keep the same drawing order as the objects list
+        self.first -= 1
+        self.ranks[obj] = self.first
+
+    def rank(self, obj):
+        return self.ranks[obj]
+
+    def at(self, x, y):
+        # return the objects at a tile
+        return sorted([obj for obj in self.buckets.get(self.bucket(x, y), ())
+                       if obj.x == x and obj.y == y], key = self.rank)
+
+    def in_rect(self, x1, y1, x2, y2):
+        # return the objects with x1 <= x <= x2 and y1 <= y <= y2
+        (bx1, by1) = self.bucket(x1, y1)
+        (bx2, by2) = self.bucket(x2, y2)
+        found = []
+        for bx in range(bx1, bx2 + 1):
+            for by in range(by1, by2 + 1):
+                for obj in self.buckets.get((bx, by), ()):
+                    if x1 <= obj.x <= x2 and y1 <= obj.y <= y2:
+                        found.append(obj)
+        found.sort(key = self.rank)
+        return found
+
+    def in_radius(self, x, y, radius):
+        # return the objects at most radius tiles away from (x, y)
+        r = int(radius)
+        return [obj for obj in self.in_rect(x - r, y - r, x + r, y + r)
+                if obj.distance(x, y) <= radius]
+
+
+
+class Scheduler:
+    # queue of the actors (objects with an AI) on the current floor, ordered
+    #   by the time they act next. time is measured in the same units as
+    #   turn_counter, so only the actors that are due pay anything
+    def __init__(self, time):
+        self.heap = []
+        # the time the actors have caught up to
+        self.time = time
+
+    def schedule(self, obj, time):
+        # ties are broken by the drawing order (see SpatialIndex), not by the
+        #   order actors were scheduled in, so a loaded game's actors take
+        #   their turns in the same order as before it was saved
+        heapq.heappush(self.heap, (time, object_index.rank(obj), obj))
+
+    def times(self):
+        # the actors in the queue and the time each of them acts next, in the
+        #   order they act
+        return [(obj, time) for (time, rank, obj) in sorted(self.heap)
+                if obj.ai]
+
+    def run_until(self, now):
+        # let every actor that is due before the given time act, and put it
+        #   back in the queue for after its action's delay
+        while self.heap and self.heap[0][0] < now:
+            (time, rank, obj) = heapq.heappop(self.heap)
+            # dead monsters lose their AI, and monsters that fall asleep
+            #   return no delay. either way they drop out of the queue
+            if obj.ai:
+                delay = obj.ai.take_turn()
+                if delay is not None:
+                    self.schedule(obj, time + delay)
+        self.time = now
+
+
+
+class FloorCache:
+    # the floors of the dungeon, numbered from 1. only the most recently
+    #   visited ones are kept in memory, the rest are packed (see
+    #   snapshot_floor) and unpacked again when the player comes back to
+    #   them. packed floors live in the saved game if they haven't changed
+    #   since it was saved, or are spilled to a cache directory if they have
+    #   (dirty floors). a dirty floor's 'dirty' is a stamp (see mark_dirty)
+    #   telling when it last changed, so it can be marked clean once a save
+    #   that has it is written, unless it changed again since
+    def __init__(self, size = FLOOR_CACHE_SIZE):
+        self.size = size
+        self.count = 0
+        # floor number -> floor, least recently visited first
+        self.floors = collections.OrderedDict()
+        # floor number -> its stamp if it's dirty (False if not), for floors
+        #   that aren't in memory
+        self.packed = {}
+        self.spill = savefile.SaveDirectory(FLOOR_CACHE_DIR)
+        self.stamp = 0
+        # the saves that are being written, as (status, [(floor number,
+        #   stamp)]). see snapshot
+        self.pending = []
+
+    def __len__(self):
+        return self.count
+
+    def put(self, floor_num, floor):
+        self.count = max(self.count, floor_num)
+        self.packed.pop(floor_num, None)
+        self.floors.pop(floor_num, None)
+        self.floors[floor_num] = floor
+        self.evict()
+
+    def get(self, floor_num):
+        if floor_num in self.floors:
+            floor = self.floors.pop(floor_num)
+        else:
+            # bring it back from disk, once any save in progress is done
+            #   writing it. if that save failed, autosave reports it
+            save_worker.finish()
+            dirty = self.packed.pop(floor_num)
+            if dirty:
+                [(tag, key, payload)] = self.spill.read(floor_key(floor_num))
+            else:
+                payload = save_store.read_floor(save_slot, floor_num)
+            floor = unpack_floor(payload, floor_num)
+            floor['dirty'] = dirty
+        self.floors[floor_num] = floor
+        self.evict()
+        return floor
+
+    def mark_dirty(self):
+        # return a new stamp for a floor that just changed
+        self.stamp += 1
+        return self.stamp
+
+    def add_saved(self, floor_num):
+        # add a floor that is only in the saved game, without reading it
+        self.count = max(self.count, floor_num)
+        self.packed[floor_num] = False
+
+    def evict(self):
+        # drop the least recently visited floors until the cache fits. floors
+        #   that changed since the last save are spilled to disk first
+        self.confirm()
+        while len(self.floors) > self.size:
+            (floor_num, floor) = self.floors.popitem(last = False)
+            if floor['dirty']:
+                self.spill.write(floor_key(floor_num),
+                    [(b'FLOR', floor_num, snapshot_floor(floor))])
+            self.packed[floor_num] = floor['dirty']
+
+    def snapshot(self):
+        # snapshot every dirty floor for the saved game, as a list of
+        #   (floor number, payload). spilled floors are packed already, they
+        #   are saved as they are. also returns the save's status, a dict
+        #   whose 'written' the save sets to True once it's written (False if
+        #   that fails): the floors stay dirty until then, see confirm
+        changed = []
+        stamps = []
+        self.confirm()
+        for floor_num in range(1, self.count + 1):
+            if floor_num in self.floors:
+                floor = self.floors[floor_num]
+                if floor['dirty']:
+                    changed.append((floor_num, snapshot_floor(floor)))
+                    stamps.append((floor_num, floor['dirty']))
+            elif self.packed[floor_num]:
+                [(tag, key, payload)] = self.spill.read(floor_key(floor_num))
+                changed.append((floor_num, payload))
+                stamps.append((floor_num, self.packed[floor_num]))
+        status = {'written': None}
+        self.pending.append((status, stamps))
+        return (changed, status)
+
+    def confirm(self):
+        # mark the floors of the saves that have been written as clean, if
+        #   they haven't changed since. the floors of a save that failed stay
+        #   dirty, so the next save writes them again
+        pending = []
+        for (status, stamps) in self.pending:
+            if status['written'] is None:
+                pending.append((status, stamps))
+            elif status['written']:
+                for (floor_num, stamp) in stamps:
+                    if floor_num in self.floors:
+                        if self.floors[floor_num]['dirty'] == stamp:
+                            self.floors[floor_num]['dirty'] = False
+                    elif self.packed.get(floor_num) == stamp:
+                        self.packed[floor_num] = False
+        self.pending = pending
 
 
 
@@ -244,8 +887,8 @@ class Rect:
         self.y2 = y + h
 
     def center(self):
-        center_x = (self.x1 + self.x2) / 2
-        center_y = (self.y1 + self.y2) / 2
+        center_x = (self.x1 + self.x2) // 2
+        center_y = (self.y1 + self.y2) // 2
         return (center_x, center_y)
 
     def intersect(self, other):
@@ -257,13 +900,19 @@ class Rect:
 
 class Fighter:
     # combat-related properties and methods (for monsters, players, NPCs, etc.)
-    def __init__(self, hp, defense, power, xp, death_function = None):
+    def __init__(self, hp, defense, power, xp, death_function = None,
+                 move_delay = MONSTER_MOVE_DELAY,
+                 attack_delay = MONSTER_ATTACK_DELAY):
         self.base_max_hp = hp
         self.hp = hp
         self.base_defense = defense
         self.base_power = power
         self.xp = xp
         self.death_function = death_function
+        # how long moving and attacking take (for monsters, the player's
+        #   actions use PLAYER_MOVE_DELAY and PLAYER_ATTACK_DELAY)
+        self.move_delay = move_delay
+        self.attack_delay = attack_delay
 
     def take_damage(self, damage):
         # apply damage if possible
@@ -277,8 +926,14 @@ class Fighter:
                 player.fighter.xp += self.xp
             if function is not None:
                 function(self.owner)
+        # a monster that survives being hurt wakes up
+        if self.owner.ai:
+            wake_monster(self.owner)
 
     def attack(self, target):
+        # fighting is loud
+        make_noise(self.owner.x, self.owner.y)
+
         # a simple formula for attack damage
         damage = self.power - target.fighter.defense
 
@@ -318,23 +973,42 @@ class Fighter:
 
 
 class BasicMonster:
-    # AI for a basic monster.
+    # AI for a basic monster. it sleeps (and isn't scheduled at all) until
+    #   wake_monster is called, then hunts the player until it loses track of
+    #   them. take_turn returns how long the turn took, or None if the monster
+    #   fell asleep
+    def __init__(self):
+        self.awake = False
+        self.alert = 0
+
     def take_turn(self):
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
-            # line of sight is reciprocal. so take turn if player can see
-            #   monster
+        if monster_vision.can_see(monster, player.x, player.y):
+            # the monster sees the player (by the light of their torch)
+            self.alert = ALERT_TURNS
             if monster.distance_to(player) >= 2:
                 # move towards player if not adjacent
-                monster.move_astar(player)
+                monster.move_chase()
             elif player.fighter.hp > 0:
                 monster.fighter.attack(player)
+                return monster.fighter.attack_delay
+        elif self.alert > 0:
+            # out of sight, but the monster still knows where to look
+            self.alert -= 1
+            monster.move_chase()
+        else:
+            # lost track of the player, go back to sleep
+            self.awake = False
+            return None
+        return monster.fighter.move_delay
 
 
 
 class ConfusedMonster:
     # AI for a temporarily confused monster (reverts to previous AI after a
-    #   while)
+    #   while). confused monsters are always awake
+    awake = True
+
     def __init__(self, old_ai, num_turns = CONFUSE_NUM_TURNS):
         self.old_ai = old_ai
         self.num_turns = num_turns
@@ -350,6 +1024,7 @@ class ConfusedMonster:
             # restore the previous AI and delete this one
             self.owner.ai = self.old_ai
             message('The ' + self.owner.name + ' is no longer confused.')
+        return self.owner.fighter.move_delay
 
 
 
@@ -365,7 +1040,7 @@ class Item:
                     self.owner.name + '.', libtcod.red)
         else:
             inventory.append(self.owner)
-            objects.remove(self.owner)
+            remove_object(self.owner)
             message('You pick up a ' + self.owner.name + '.',
                     libtcod.green)
             # special case: equip something if slot is open
@@ -388,10 +1063,10 @@ class Item:
 
     def drop(self):
         # add to the map and remove from the player's inventory
-        objects.append(self.owner)
         inventory.remove(self.owner)
         self.owner.x = player.x
         self.owner.y = player.y
+        add_object(self.owner)
         # special case: remove item, if it's equipment
         if self.owner.equipment:
             self.owner.equipment.unequip()
@@ -399,6 +1074,15 @@ class Item:
 
 
 
+class Light:
+    # a light source, such as a brazier. it lights the tiles it can see
+    #   within radius, less the farther they are (see LightMap)
+    def __init__(self, radius, intensity = LIGHT_FULL):
+        self.radius = radius
+        self.intensity = intensity
+
+
+
 class Equipment:
     # an object that can be equipped, yielding bonuses.
     def __init__(self, slot, power_bonus = 0, defense_bonus = 0,
@@ -439,9 +1123,9 @@ class Equipment:
 #########################
 ####### FUNCTIONS #######
 #########################
-def new_game():
+def new_game(slot = 1):
     global player, inventory, game_msgs, game_state, dungeon_level, turn_counter
-    global floors
+    global floors, last_autosave, journal_serial, save_slot
 
     # create object representing the player
     fighter_component = Fighter(hp = 100 , defense = 1, power = 2,
@@ -452,15 +1136,28 @@ def new_game():
 
     player.level = 1
 
+    # start turn counter
+    turn_counter = 1
+    last_autosave = turn_counter
+
+    # the game is saved in the given slot, replacing the game saved there on
+    #   its first save (right away, see the end). the journals of the old game
+    #   are kept until that save is written (see write_save) in case it never
+    #   is. the new game's journals are numbered after them, leaving a gap so
+    #   they're never read as the old game's
+    save_slot = slot
+    stop_journal()
+    journal_serial = journal_directory().last_journal() + 1
+
     # generate the map (but don't draw to screen yet) and
     #  initialize fov
     dungeon_level = 1
     make_map()
-    initialize_fov()
+    initialize_floor()
 
     game_state = 'playing'
     inventory = []
-    floors = []
+    floors = FloorCache()
 
     # create list of game message and their colors
     game_msgs = []
@@ -473,67 +1170,177 @@ def new_game():
     equipment_component.equip()
     obj.always_visible = True
 
-    # start turn counter
-    turn_counter = 1
-
     # test welcome message
     message('Welcome to Hideous Truths!', libtcod.purple)
 
+    # save the new game, which starts its first journal, so it can be
+    #   recovered from the very first turn
+    autosave()
+
+
+
+def initialize_floor(times = None):
+    # set up everything that is kept per floor, after the floor is created or
+    #   loaded and the player is in place on it (or the index would keep
+    #   them in the wrong bucket). times are the actors' turns, see
+    #   initialize_schedule
+    index_objects()
+    initialize_fov()
+    initialize_pathing()
+    initialize_schedule(times)
+
 
 
 def initialize_fov():
-    global fov_recompute, fov_map
+    global fov_recompute, fov_map, visible_tiles, drawn_tiles, drawn_objects
+    global fov_cache, light_map, torch_tiles, monster_vision, visibility
     fov_recompute = True
-
-    # make sure unexplored areas start black
+    fov_cache = FovCache()
+    if visibility is not None:
+        visibility.stop()
+        visibility = None
+    if PRECOMPUTE_FOV:
+        visibility = VisibilityTable(map, TORCH_RADIUS, (player.x, player.y))
+    light_map = LightMap()
+    monster_vision = MonsterVision(SIGHT_RADIUS)
+    visible_tiles = numpy.zeros((MAP_WIDTH, MAP_HEIGHT), dtype = bool,
+                                order = 'F')
+    torch_tiles = visible_tiles
+
+    # make sure unexplored areas start black, and have render_all redraw
+    #   everything on its next call
     libtcod.console_clear(con)
+    drawn_tiles = None
+    drawn_objects = {}
+
+    # set the FOV map (created once) from the floor's map, all of its cells
+    #   at once
+    if fov_map is None:
+        fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
+    libtcod.map_set_arrays(fov_map, ~map.block_sight, ~map.blocked)
+
 
-    # create FOV map according to generated map
-    fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y,
-                                       not map[x][y].block_sight,
-                                       not map[x][y].blocked)
+
+def initialize_pathing():
+    global chase_map, chase_root
+    # the chase map is a distance field from the player over the floor's
+    #   terrain, shared by every monster chasing the player
+    if chase_map is not None:
+        libtcod.dijkstra_delete(chase_map)
+    chase_map = libtcod.dijkstra_new(fov_map, 1.41)
+    chase_root = None
+
+
+
+def initialize_schedule(times = None):
+    global schedule
+    # every awake actor on the floor gets to act once the player's next action
+    #   is done, or at the times given as (actor, time), e.g. from
+    #   Scheduler.times. sleeping ones are added when they wake up
+    schedule = Scheduler(turn_counter)
+    if times is None:
+        times = [(obj, turn_counter) for obj in objects
+                 if obj.ai and obj.ai.awake]
+    for (obj, time) in times:
+        schedule.schedule(obj, time)
+
+
+
+def update_chase_map():
+    global chase_root
+    # recompute the chase map, but only once for each position of the player
+    #   (i.e. at most once per player turn) no matter how many monsters ask
+    if chase_root != (player.x, player.y):
+        libtcod.dijkstra_compute(chase_map, player.x, player.y)
+        chase_root = (player.x, player.y)
 
 
 
 def play_game():
     global key, mouse
 
-    player_action = None
-
     # get mouse and keyboard for input
     mouse = libtcod.Mouse()
     key = libtcod.Key()
 
     while not libtcod.console_is_window_closed():
-        # render the screen
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS |
-                                    libtcod.EVENT_MOUSE,
-                                    key, mouse)
-        render_all()
-        
-        # update on-screen console
-        libtcod.console_flush()
-        check_level_up()
-
-        # clear all objects (to avoid objects showing up in all of their
-        #  previous positions once they've moved)
-        for object in objects:
-            object.clear()
-
-        # handle keys and exit game if needed
-        player_action = handle_keys()
+        # play one frame, and exit game if needed
+        player_action = play_turn()
         if player_action == 'exit':
             save_game()
+            stop_journal()
             break
 
-        # let monsters take their turn
-        if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.ai:
-                    object.ai.take_turn()
+
+
+def play_turn():
+    # render the screen
+    libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS |
+                                libtcod.EVENT_MOUSE,
+                                key, mouse)
+    render_all()
+
+    # update on-screen console
+    libtcod.console_flush()
+    check_level_up()
+
+    # handle keys
+    player_action = handle_keys()
+
+    # let monsters take their turn
+    if game_state == 'playing' and player_action not in ('didnt-take-turn',
+                                                          'exit'):
+        take_monster_turns()
+
+        if turn_counter >= last_autosave + AUTOSAVE_INTERVAL:
+            autosave()
+
+    if journal is not None:
+        journal.flush()
+
+    return player_action
+
+
+
+def take_monster_turns():
+    # the player's action moved turn_counter on by its delay, let the monsters
+    #   catch up. the ones close enough to see the player look for them first,
+    #   all at once
+    monster_vision.update([(obj.x, obj.y) for obj in
+                           object_index.in_radius(player.x, player.y,
+                                                  SIGHT_RADIUS) if obj.ai])
+    wake_monsters()
+    schedule.run_until(turn_counter)
+
+
+
+def wake_monster(monster):
+    # wake a sleeping monster up and have it act from the start of the
+    #   current turn on
+    if not monster.ai.awake:
+        monster.ai.awake = True
+        monster.ai.alert = ALERT_TURNS
+        schedule.schedule(monster, schedule.time)
+
+
+
+def wake_monsters():
+    # wake the sleeping monsters that can see the player or are close enough
+    #   to notice them. only the monsters near the player are looked at, so
+    #   the rest of the floor costs nothing
+    for obj in object_index.in_radius(player.x, player.y, SIGHT_RADIUS):
+        if obj.ai and not obj.ai.awake:
+            if (obj.distance_to(player) <= WAKE_RADIUS or
+                monster_vision.can_see(obj, player.x, player.y)):
+                wake_monster(obj)
+
+
+
+def make_noise(x, y, radius = NOISE_RADIUS):
+    # wake every sleeping monster within earshot of (x, y)
+    for obj in object_index.in_radius(x, y, radius):
+        if obj.ai:
+            wake_monster(obj)
 
 
 
@@ -546,25 +1353,36 @@ def main_menu():
 
         # show the game's title, and some credits
         libtcod.console_set_default_foreground(0, libtcod.violet)
-        libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT/2 - 4, 
+        libtcod.console_print_ex(0, SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 4, 
             libtcod.BKGND_NONE, libtcod.CENTER, 'HIDEOUS TRUTHS')
-        libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT - 2, 
+        libtcod.console_print_ex(0, SCREEN_WIDTH//2, SCREEN_HEIGHT - 2, 
             libtcod.BKGND_NONE, libtcod.CENTER, "By Brian O'Connor")
 
         # show options and wait for the player's choice
         choice = menu('', ['Play a new game', 'Load a saved game', 'Quit'], 24)
 
         if choice == 0:
-            # new_game
-            new_game()
+            # new_game, in a slot chosen by the player
+            slot = choose_slot('Choose a slot for the new game. The game ' +
+                               'saved there will be replaced.\n')
+            if slot is None:
+                continue
+            new_game(slot)
             play_game()
         elif choice == 1:
-            # load last game
+            # load a saved game
+            slot = choose_slot('Choose a saved game to load.\n')
+            if slot is None:
+                continue
             try:
-                load_game()
-            except:
+                load_game(slot)
+            except KeyError:
                 msgbox('\n No saved game to load.\n', 24)
                 continue
+            except savefile.READ_ERRORS as error:
+                msgbox('\n The saved game can\'t be loaded: ' + str(error) +
+                       '\n', 50)
+                continue
             play_game()
         elif choice == 2:
             # quit
@@ -572,55 +1390,457 @@ def main_menu():
 
 
 
+def choose_slot(header):
+    # show the save slots, with what the menu needs to know about the game
+    #   saved in each (read without loading any of them), and return the
+    #   slot the player picked, or None
+    saved = {}
+    try:
+        for (slot, level, turn, player_level, saved_at) in save_store.slots():
+            saved[slot] = ('Dungeon level ' + str(level) + ', turn ' +
+                           str(int(turn)) + ', player level ' +
+                           str(player_level) + ', saved ' +
+                           time.strftime('%Y-%m-%d %H:%M',
+                                         time.localtime(saved_at)))
+    except savefile.READ_ERRORS:
+        # saves from another version of the game can't be loaded, and a
+        #   damaged or locked database can't be read. the slots show up empty
+        pass
+
+    options = [saved.get(slot, 'Empty')
+               for slot in range(1, SAVE_SLOTS + 1)]
+    index = menu(header, options, SLOT_MENU_WIDTH)
+    if index is None:
+        return None
+    return index + 1
+
+
+
 def save_game():
-    # open a new empty shelve (possibily overwriting an old one) to write the
-    #   game data
-    save = shelve.open('savegame', 'n')
-    # save each game state variable. don't save objects if they're also in a
-    #   saved list
-    save['map'] = map
-    save['objects'] = objects
-    # this avoids the problem mentioned above
-    save['player_index'] = objects.index(player)
-    save['downstairs_index'] = objects.index(downstairs)
-    save['upstairs_index'] = objects.index(upstairs)
-    save['inventory'] = inventory
-    save['game_msgs'] = game_msgs
-    save['game_state'] = game_state
-    save['dungeon_level'] = dungeon_level
-    save['turn_counter'] = turn_counter
-    save['floors'] = floors
-    save.close()
-
-
-
-def load_game():
-    # open the previously saved shelve and load the game data
-    global map, objects, player, inventory, game_msgs, game_state,\
-           downstairs, upstairs, dungeon_level, turn_counter, floors 
-          
-
-    save = shelve.open('savegame', 'r')
-    map = save['map']
-    objects = save['objects']
-    player = objects[save['player_index']]
-    downstairs = objects[save['downstairs_index']]
-    upstairs = objects[save['upstairs_index']]
-    inventory = save['inventory']
-    game_msgs = save['game_msgs']
-    game_state = save['game_state']
-    dungeon_level = save['dungeon_level']
-    turn_counter = save['turn_counter']
-    floors = save['floors']
-    save.close()
+    # save the game and wait until it's on disk
+    autosave()
+    save_worker.wait()
 
-    initialize_fov()
+
+
+def autosave():
+    global last_autosave
+    # write the game to its slot of the save store: the game state and the
+    #   player's inventory, and every floor that changed since the last save
+    #   (the dirty ones), so saving doesn't get slower as the dungeon gets
+    #   deeper. only a snapshot of the records to save is taken here, packing
+    #   and writing them happens on save_worker's thread so the game doesn't
+    #   stall
+    error = save_worker.take_error()
+    if error is not None:
+        message('Saving the game failed: ' + str(error), libtcod.red)
+
+    save_floor(dungeon_level)
+    (changed, status) = floors.snapshot()
+    # what is played from here on goes into a new journal
+    journals = journal_directory()
+    start_journal(journals)
+    save_worker.submit(write_save, save_slot,
+                       (dungeon_level, turn_counter, player.level,
+                        time.time()),
+                       snapshot_game(), changed, len(floors), journals,
+                       journal_serial, status)
+    last_autosave = turn_counter
+
+
+
+def write_save(slot, info, game, changed, num_floors, journals, serial,
+               status):
+    # save_worker's job for autosave: write the save, then remove the
+    #   journals from before it. if writing fails, the save that is left still
+    #   needs them, so they are only removed once the new one is written.
+    #   status tells the floor cache how it went (see FloorCache.snapshot)
+    try:
+        save_store.write(slot, info, game, changed, num_floors)
+    except:
+        status['written'] = False
+        raise
+    status['written'] = True
+    journals.remove_journals(serial)
+
+
+
+def load_game(slot = 1):
+    # open the game saved in a slot and load the game data
+    global floors, save_slot
+
+    save_worker.finish()
+    save_slot = slot
+    # the game comes first, so the player exists by the time floors are
+    #   unpacked
+    num_floors = unpack_game(save_store.read_game(slot))
+
+    # the floors are only read when the player gets to them
+    floors = FloorCache()
+    for floor_num in range(1, num_floors + 1):
+        floors.add_saved(floor_num)
+
+    # the actors take their turns when they would have if the game hadn't
+    #   been saved
+    floor = load_floor(dungeon_level)
+    initialize_floor(floor['schedule'])
+
+    # get back what was played after the save (e.g. if the game crashed),
+    #   then save again so it's safe
+    stop_journal()
+    journals = journal_directory().read_journals(journal_serial)
+    for (turn, seed, entries) in journals:
+        if turn != turn_counter:
+            # it doesn't follow on from where the game is
+            break
+        seed_random(seed)
+        replay_journal(entries)
+    autosave()
+
+
+
+def journal_directory():
+    # the directory of the current slot's journals
+    return savefile.SaveDirectory(JOURNAL_DIR % save_slot)
+
+
+
+def start_journal(store):
+    global journal, journal_serial
+    # start a new journal in a journal directory. the random number
+    #   generator's state can't be saved, so it is reseeded here instead and
+    #   the journal only has to hold the seed to play the same game again
+    stop_journal()
+    seed = libtcod.random_get_int(0, 0, MAX_FLOOR_SEED)
+    seed_random(seed)
+    journal_serial += 1
+    journal = store.open_journal(journal_serial, turn_counter, seed)
+
+
+
+def stop_journal():
+    global journal
+    if journal is not None:
+        journal.close()
+        journal = None
+
+
+
+def record_input(kind, a = 0, b = 0):
+    # log input the game acted on to the journal: b'K' for keys handled by
+    #   handle_keys (vk, c), b'M' for menu choices (c), b'T' for target
+    #   tiles (x, y, or -1, -1 if cancelled)
+    if journal is not None:
+        journal.append(kind, a, b)
+
+
+
+def replay_input(kind):
+    # while a journal is being replayed, return the next input logged in it
+    #   as (a, b) if it is of the given kind. otherwise (or once the journal
+    #   runs out) return None, so the input is read as usual
+    if replay_entries and replay_entries[0][0] == kind:
+        (kind, a, b) = replay_entries.popleft()
+        return (a, b)
+    return None
+
+
+
+def replay_journal(entries):
+    global key, fov_recompute, replay_entries
+    # play the input logged in a journal again, the way play_turn would, but
+    #   without drawing anything or waiting for the player
+    key = libtcod.Key()
+    replay_entries = collections.deque(entries)
+    while replay_entries:
+        update_fov()
+        check_level_up()
+
+        entry = replay_input(b'K')
+        if entry is None:
+            break
+        (key.vk, key.c) = entry
+        player_action = handle_keys()
+        if game_state == 'playing' and player_action not in (
+                'didnt-take-turn', 'exit'):
+            take_monster_turns()
+
+    replay_entries = None
+    # have render_all draw the map as it is now
+    fov_recompute = True
+
+
+
+def snapshot_game():
+    # pack the state that isn't kept per floor, the player included, into
+    #   records. they only hold copies of the game's values, so they can be
+    #   packed and written later
+    writer = savefile.RecordWriter(OBJECT_RECORDS + GAME_RECORDS)
+    writer.add('game', dungeon_level, turn_counter, writer.string(game_state),
+               pack_object(writer, player), player.level, len(floors),
+               journal_serial)
+    for obj in inventory:
+        writer.add('inventory', pack_object(writer, obj))
+    for (line, color) in game_msgs:
+        writer.add('message', writer.string(line), color.r, color.g, color.b)
+    return writer
+
+
+
+def unpack_game(payload):
+    global player, inventory, game_msgs, game_state, dungeon_level,\
+           turn_counter, journal_serial
+    # unpack the state saved by snapshot_game, and return how many floors the
+    #   game has
+    reader = savefile.RecordReader(payload, OBJECT_RECORDS + GAME_RECORDS)
+    (dungeon_level, turn_counter, state, player_index, player_level,
+     num_floors, journal_serial) = reader.records['game'][0]
+    game_state = reader.string(state)
+
+    packed_objects = unpack_objects(reader)
+    player = packed_objects[player_index]
+    player.level = player_level
+    inventory = [packed_objects[index]
+                 for (index,) in reader.records['inventory']]
+    game_msgs = [(reader.string(line), libtcod.Color(r, g, b))
+                 for (line, r, g, b) in reader.records['message']]
+    return num_floors
+
+
+
+def snapshot_floor(floor):
+    # pack a floor (as stored by save_floor) into records. a floor can be
+    #   generated again from its seed, so only what changed since then is
+    #   saved: the explored tiles, tiles changed since generation, and the
+    #   objects that aren't just as they were generated (moved, hurt, killed,
+    #   dropped there...). generated objects that are gone (e.g. picked up)
+    #   are left out of the objects' order
+    writer = savefile.RecordWriter(OBJECT_RECORDS + FLOOR_RECORDS)
+    floor_map = floor['map']
+    origin = floor['origin']
+    writer.add('floor', origin['seed'])
+
+    generated = {}
+    for (i, obj) in enumerate(origin['generated']):
+        generated[obj] = i
+    for obj in floor['objects']:
+        if obj == player:
+            writer.add('order', -2, -1)
+        elif obj not in generated:
+            writer.add('order', -1, pack_object(writer, obj))
+        elif object_state(obj) != origin['pristine'][generated[obj]]:
+            writer.add('order', generated[obj], pack_object(writer, obj))
+        else:
+            writer.add('order', generated[obj], -1)
+
+    for ((x, y), (blocked, block_sight)) in sorted(floor_map.edits.items()):
+        writer.add('tile', x, y, blocked, block_sight)
+    positions = dict((obj, i) for (i, obj) in enumerate(floor['objects']))
+    for (obj, time) in floor['schedule']:
+        writer.add('schedule', positions[obj], time)
+    writer.blob(savefile.pack_bits(floor_map.explored))
+    return writer
+
+
+
+def unpack_floor(payload, floor_num):
+    # unpack a floor saved by snapshot_floor: generate it again from its seed,
+    #   then apply what changed
+    reader = savefile.RecordReader(payload, OBJECT_RECORDS + FLOOR_RECORDS)
+    (seed,) = reader.records['floor'][0]
+    floor = generate_floor(floor_num, seed)
+    del floor['stand_in']
+    floor_map = floor['map']
+
+    generated = floor['origin']['generated']
+    stairs = [generated.index(floor['downstairs'])]
+    if floor['upstairs'] is not None:
+        stairs.append(generated.index(floor['upstairs']))
+
+    floor['objects'] = []
+    for (generated_index, record_index) in reader.records['order']:
+        if generated_index == -2:
+            obj = player
+        elif record_index < 0:
+            obj = generated[generated_index]
+        else:
+            obj = unpack_object(reader, reader.records['object'][record_index])
+            if generated_index >= 0:
+                # it takes the place of the generated object
+                generated[generated_index] = obj
+        floor['objects'].append(obj)
+
+    floor['downstairs'] = generated[stairs[0]]
+    if floor['upstairs'] is not None:
+        floor['upstairs'] = generated[stairs[1]]
+
+    for (x, y, blocked, block_sight) in reader.records['tile']:
+        floor_map.blocked[x, y] = blocked
+        floor_map.block_sight[x, y] = block_sight
+        floor_map.edits[(x, y)] = (bool(blocked), bool(block_sight))
+    floor_map.explored = savefile.unpack_bits(reader.blobs[0],
+                                              (floor_map.width,
+                                               floor_map.height))
+    floor['schedule'] = [(floor['objects'][position], time)
+                         for (position, time) in reader.records['schedule']]
+
+    # it's just been read, so it's the same as what's saved
+    floor['dirty'] = False
+    return floor
+
+
+
+def object_state(obj):
+    # everything about an object that would be saved, to tell whether a
+    #   generated object changed since it was generated
+    writer = savefile.RecordWriter(OBJECT_RECORDS)
+    pack_object(writer, obj)
+    return (tuple(writer.strings),
+            tuple(tuple(writer.records[name]) for (name, fmt)
+                  in OBJECT_RECORDS))
+
+
+
+def pack_object(writer, obj):
+    # add an object and its components to the record tables, and return the
+    #   object's index
+    fighter_index = -1
+    if obj.fighter:
+        fighter = obj.fighter
+        fighter_index = writer.add('fighter', fighter.base_max_hp, fighter.hp,
+            fighter.base_defense, fighter.base_power, fighter.xp,
+            writer.string(function_name(fighter.death_function)),
+            fighter.move_delay, fighter.attack_delay)
+
+    ai_index = -1
+    if obj.ai:
+        ai_index = pack_ai(writer, obj.ai)
+
+    # equipment gets its item component from Object itself
+    item_index = -1
+    if obj.item and not obj.equipment:
+        item_index = writer.add('item',
+            writer.string(function_name(obj.item.use_function)))
+
+    equipment_index = -1
+    if obj.equipment:
+        equipment = obj.equipment
+        equipment_index = writer.add('equipment',
+            writer.string(equipment.slot), equipment.is_equipped,
+            equipment.power_bonus, equipment.defense_bonus,
+            equipment.max_hp_bonus)
+
+    light_index = -1
+    if obj.light:
+        light_index = writer.add('light', obj.light.radius, obj.light.intensity)
+
+    flags = int(obj.blocks) | int(obj.always_visible) << 1
+    return writer.add('object', obj.x, obj.y, ord(obj.char),
+                      writer.string(obj.name),
+                      obj.color.r, obj.color.g, obj.color.b, flags,
+                      fighter_index, ai_index, item_index, equipment_index,
+                      light_index)
+
+
+
+def pack_ai(writer, ai):
+    # add an AI component (and the one it replaced, for confused monsters)
+    #   and return its index
+    ai_type = ai_types.index(ai.__class__)
+    if isinstance(ai, ConfusedMonster):
+        return writer.add('ai', ai_type, 1, 0, ai.num_turns,
+                          pack_ai(writer, ai.old_ai))
+    else:
+        return writer.add('ai', ai_type, ai.awake, ai.alert, 0, -1)
+
+
+
+def unpack_objects(reader):
+    # rebuild every object in a reader's record tables, in order
+    return [unpack_object(reader, record)
+            for record in reader.records['object']]
+
+
+
+def floor_key(floor_num):
+    # the key a floor is spilled under
+    return 'floor-%d' % floor_num
+
+
+
+def unpack_object(reader, record):
+    (x, y, char, name, r, g, b, flags, fighter_index, ai_index, item_index,
+     equipment_index, light_index) = record
+
+    fighter = None
+    if fighter_index >= 0:
+        (base_max_hp, hp, base_defense, base_power, xp, death_function,
+         move_delay, attack_delay) = reader.records['fighter'][fighter_index]
+        fighter = Fighter(base_max_hp, base_defense, base_power, xp,
+                          save_functions.get(reader.string(death_function)),
+                          move_delay, attack_delay)
+        fighter.hp = hp
+
+    ai = None
+    if ai_index >= 0:
+        ai = unpack_ai(reader, ai_index)
+
+    item = None
+    if item_index >= 0:
+        (use_function,) = reader.records['item'][item_index]
+        item = Item(save_functions.get(reader.string(use_function)))
+
+    equipment = None
+    if equipment_index >= 0:
+        (slot, is_equipped, power_bonus, defense_bonus,
+         max_hp_bonus) = reader.records['equipment'][equipment_index]
+        equipment = Equipment(reader.string(slot), power_bonus, defense_bonus,
+                              max_hp_bonus)
+        equipment.is_equipped = bool(is_equipped)
+
+    light = None
+    if light_index >= 0:
+        (radius, intensity) = reader.records['light'][light_index]
+        light = Light(radius, intensity)
+
+    obj = Object(x, y, chr(char), reader.string(name), libtcod.Color(r, g, b),
+                 blocks = bool(flags & 1), always_visible = bool(flags & 2),
+                 fighter = fighter, ai = ai, item = item,
+                 equipment = equipment, light = light)
+
+    # AIs replaced by a confused one need to know their owner too
+    while isinstance(ai, ConfusedMonster):
+        ai = ai.old_ai
+        ai.owner = obj
+    return obj
+
+
+
+def unpack_ai(reader, index):
+    (ai_type, awake, alert, num_turns, old_ai) = reader.records['ai'][index]
+    if ai_types[ai_type] == ConfusedMonster:
+        return ConfusedMonster(unpack_ai(reader, old_ai), num_turns)
+    ai = ai_types[ai_type]()
+    ai.awake = bool(awake)
+    ai.alert = alert
+    return ai
+
+
+
+def function_name(function):
+    # the name a use or death function is saved under
+    if function is None:
+        return None
+    return function.__name__
 
 
 
 def handle_keys():
     global fov_recompute, key, turn_counter
 
+    if key.vk != libtcod.KEY_NONE:
+        record_input(b'K', key.vk, key.c)
+
     # non-movement command keys
     if key.vk == libtcod.KEY_ENTER and key.lalt:
         # Alt+Enter: toggle fullscreen
@@ -701,8 +1921,8 @@ def handle_keys():
 
         elif (key.vk == libtcod.KEY_KP3 or
             (key.vk == libtcod.KEY_CHAR and key.c == ord('.'))):
-            # do nothing
-            pass
+            # do nothing, for as long as a step would take
+            turn_counter += PLAYER_MOVE_DELAY
 
         else:
             # test for other keys
@@ -711,9 +1931,8 @@ def handle_keys():
             if key_char == ',':
                 items = []
                 # pick up an item
-                for object in objects:
-                    if (object.x == player.x and object.y == player.y and
-                        object.item):
+                for object in object_index.at(player.x, player.y):
+                    if object.item:
                         items.append(object)
                 if len(items) == 1:
                     items[0].item.pick_up()
@@ -761,7 +1980,8 @@ def handle_keys():
                 if downstairs.x == player.x and downstairs.y == player.y:
                     turn_counter += 1
                     next_level()
-                elif upstairs.x == player.x and upstairs.y == player.y:
+                elif (upstairs is not None and
+                      upstairs.x == player.x and upstairs.y == player.y):
                     turn_counter += 1
                     prev_level()
 
@@ -770,26 +1990,52 @@ def handle_keys():
 
 
 def make_map():
-    global map, objects, downstairs, upstairs
+    global map, objects, downstairs, upstairs, floor_origin
+    # generate a new floor for the current dungeon level and make it the
+    #   current floor. every floor gets a seed of its own, so it can be
+    #   generated again exactly the same (see unpack_floor)
+    floor = generate_floor(dungeon_level,
+                           libtcod.random_get_int(0, 0, MAX_FLOOR_SEED))
+    map = floor['map']
+    objects = floor['objects']
+    downstairs = floor['downstairs']
+    upstairs = floor['upstairs']
+    floor_origin = floor['origin']
+
+    # the player takes the place of their stand-in
+    stand_in = floor['stand_in']
+    objects[objects.index(stand_in)] = player
+    player.x = stand_in.x
+    player.y = stand_in.y
 
-    # create list of objects with just the player
-    objects = [player]
 
-    # fill map with "unblocked" tiles
-    map = [[ Tile(True) 
-        for y in range(MAP_HEIGHT) ]
-            for x in range(MAP_WIDTH) ]
+
+def generate_floor(floor_num, seed):
+    # build a floor from its own random generator, seeded with seed. only the
+    #   seed and floor_num decide what the floor looks like. returns the floor
+    #   like save_floor stores it, with a stand-in object where the player
+    #   starts, and the floor's origin: the seed, the generated objects and
+    #   their state right after generation (see object_state)
+    rng = libtcod.random_new_from_seed(seed)
+
+    # fill map with "blocked" tiles. the stand-in is there from the start so
+    #   nothing is placed where the player will be
+    stand_in = Object(0, 0, '@', 'player', libtcod.white, blocks = True)
+    floor = {'map': TileMap(MAP_WIDTH, MAP_HEIGHT, True),
+             'objects': [], 'index': SpatialIndex(), 'level': floor_num,
+             'upstairs': None, 'stand_in': stand_in}
+    place_object(floor, stand_in)
 
     rooms = []
     num_rooms = 0
 
     for r in range(MAX_ROOMS):
         # random width and height
-        w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-        h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+        w = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+        h = libtcod.random_get_int(rng, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
         # random position within boundaries of map
-        x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-        y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
+        x = libtcod.random_get_int(rng, 0, MAP_WIDTH - w - 1)
+        y = libtcod.random_get_int(rng, 0, MAP_HEIGHT - h - 1)
 
         new_room = Rect(x, y, w, h)
         failed = False
@@ -800,19 +2046,20 @@ def make_map():
 
         if not failed:
             # if the room doesn't intersect with any others, add it to the map
-            create_room(new_room)
+            create_room(floor['map'], new_room)
             # get center coordinates of new room
             (new_x, new_y) = new_room.center()
 
             if num_rooms == 0:
                 # start the player in the center of the first room
-                player.x = new_x
-                player.y = new_y
-                if dungeon_level > 1:
-                    upstairs = Object(new_x, new_y, '<', 'upstairs',
-                                      libtcod.white, always_visible = True)
-                    objects.append(upstairs)
-                    upstairs.send_to_back()
+                floor['index'].move(stand_in, new_x, new_y)
+                stand_in.x = new_x
+                stand_in.y = new_y
+                if floor_num > 1:
+                    floor['upstairs'] = Object(new_x, new_y, '<', 'upstairs',
+                                               libtcod.white,
+                                               always_visible = True)
+                    place_object(floor, floor['upstairs'], to_back = True)
             else:
                 # after the first room, connect to the previous room by tunnel
                 # get center of previous room
@@ -820,55 +2067,71 @@ def make_map():
 
                 # randomly decide whether to move horizontally or vertically
                 #   first
-                if libtcod.random_get_int(0, 0, 1) == 1:
+                if libtcod.random_get_int(rng, 0, 1) == 1:
                     # move horizontally first
-                    create_h_tunnel(prev_x, new_x, prev_y)
-                    create_v_tunnel(prev_y, new_y, new_x)
+                    create_h_tunnel(floor['map'], prev_x, new_x, prev_y)
+                    create_v_tunnel(floor['map'], prev_y, new_y, new_x)
                 else:
                     # move vertically first
-                    create_v_tunnel(prev_y, new_y, prev_x)
-                    create_h_tunnel(prev_x, new_x, new_y)
+                    create_v_tunnel(floor['map'], prev_y, new_y, prev_x)
+                    create_h_tunnel(floor['map'], prev_x, new_x, new_y)
 
-            place_objects(new_room)
+            place_objects(floor, new_room, rng)
             rooms.append(new_room)
             num_rooms += 1
 
     # create downstairs at the center of the last room
-    downstairs = Object(new_x, new_y, '>', 'downstairs', libtcod.white,
-                    always_visible = True)
-    objects.append(downstairs)
-    downstairs.send_to_back()
+    floor['downstairs'] = Object(new_x, new_y, '>', 'downstairs',
+                                 libtcod.white, always_visible = True)
+    place_object(floor, floor['downstairs'], to_back = True)
+
+    libtcod.random_delete(rng)
+    del floor['index']
+
+    generated = [obj for obj in floor['objects'] if obj != stand_in]
+    floor['origin'] = {'seed': seed, 'generated': generated,
+                       'pristine': [object_state(obj) for obj in generated]}
+    return floor
+
+
+
+def place_object(floor, obj, to_back = False):
+    # put an object on a floor that is being generated, optionally at the
+    #   back so it's drawn below other objects
+    if to_back:
+        floor['objects'].insert(0, obj)
+    else:
+        floor['objects'].append(obj)
+    floor['index'].add(obj, to_back)
 
 
 
 def save_floor(floor_num):
     global floors
-    # store a floor in an array so it can be returned to later
-    if floor_num > 1:
-        floor = {'map': map, 'objects': objects, 'downstairs': downstairs,
-                 'upstairs': upstairs}
-    else:
-        floor = {'map': map, 'objects': objects, 'downstairs': downstairs}
-    
-    if floor_num > len(floors):
-        floors.append(floor)
-    else:
-        floors[floor_num - 1] = floor
+    # store a floor in the floor cache so it can be returned to later. it's
+    #   marked dirty, so the next save_game writes it
+    floor = {'map': map, 'objects': objects, 'downstairs': downstairs,
+             'upstairs': upstairs, 'origin': floor_origin,
+             'schedule': schedule.times(), 'dirty': floors.mark_dirty()}
+    floors.put(floor_num, floor)
 
 
 
 def load_floor(floor_num):
-    global floors, map, objects, downstairs, upstairs
-    # load a previously seen floor
-
-    floor = floors[floor_num - 1]
+    global floors, map, objects, downstairs, upstairs, floor_origin
+    # load a previously seen floor (from disk, if it was evicted from the
+    #   floor cache)
+    floor = floors.get(floor_num)
+    # the player is about to change it, so the next save_game writes it
+    floor['dirty'] = floors.mark_dirty()
     map = floor['map']
     objects = floor['objects']
 
     downstairs = floor['downstairs']
-    if floor_num > 1:
-        upstairs = floor['upstairs']            
-    
+    upstairs = floor['upstairs']
+    floor_origin = floor['origin']
+    return floor
+
 
 
 def next_level():
@@ -886,7 +2149,7 @@ def next_level():
         player.y = upstairs.y
         message('You walk down a flight of stairs.', libtcod.yellow)
 
-    initialize_fov()
+    initialize_floor()
 
 
 
@@ -901,53 +2164,129 @@ def prev_level():
     player.y = downstairs.y
     message('You walk up a flight of stairs.', libtcod.yellow)
 
-    initialize_fov()
+    initialize_floor()
 
 
 
-def render_all():
-    global fov_recompute, fov_map
-
-    if fov_recompute:
-        # recompute FOV if needed (e.g. the player moved)
-        fov_recompute = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS,
-                                FOV_LIGHT_WALLS, FOV_ALGO)
-
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            wall = map[x][y].block_sight
-            visible = libtcod.map_is_in_fov(fov_map, x, y)
-            if not visible:
-                if map[x][y].explored:
-                    # if tile is outside of player's FOV and has been
-                    #  explored
-                    if wall:
-                        libtcod.console_put_char_ex(con, x, y, '#',
-                            color_dark_wall, color_dark_wall)
-                    else:
-                        libtcod.console_put_char_ex(con, x, y, '.',
-                            color_dark_floor, libtcod.black)
-                else:
-                    libtcod.console_put_char_ex(con, x, y, ' ',
-                        libtcod.black, libtcod.black)
-            else:
-                # if tile is visible
-                if wall:
-                    libtcod.console_put_char_ex(con, x, y, '#',
-                        color_light_wall, color_light_wall)
-                else:
-                    libtcod.console_put_char_ex(con, x, y, '.', 
-                        color_light_floor, libtcod.black)
-                map[x][y].explored = True
+def update_fov():
+    global fov_recompute
+    # recompute the FOV if the player moved, the terrain changed or a light
+    #   moved or changed, and return whether it was
+    if light_map.update(objects):
+        fov_recompute = True
+    if not fov_recompute:
+        return False
+    fov_recompute = False
+    compute_fov()
+    return True
+
+
+
+def compute_fov():
+    global visible_tiles, torch_tiles
+    # find the tiles the player can see: the ones their torch lights, and the
+    #   ones in their line of sight that other lights fall on. fov_map's FOV
+    #   isn't up to date when it comes from the cache, so use in_fov or
+    #   visible_tiles, not map_is_in_fov, to know what the player sees. the
+    #   light map is brought up to date by update_fov
+    torch_tiles = field_of_view(player.x, player.y, TORCH_RADIUS)
+    if light_map.lights:
+        sight = field_of_view(player.x, player.y, 0)
+        visible_tiles = torch_tiles | (sight & (light_map.levels > 0))
+    else:
+        visible_tiles = torch_tiles
+    # every tile the player can see counts as explored from now on
+    map.explored |= visible_tiles
+
 
-    # draw all objects in the list, except player
+
+def field_of_view(x, y, radius):
+    # return the tiles that can be seen from (x, y) within radius (0 for no
+    #   limit). that only changes with the terrain, so the FOV from a tile is
+    #   only computed the first time it's asked for (until fov_cache forgets
+    #   it)
+    key = (x, y, radius, map.revision)
+    visible = fov_cache.get(key)
+    if visible is None and visibility and visibility.radius == radius:
+        visible = visibility.get(x, y)
+    if visible is None:
+        visible = compute_map_fov(fov_map, x, y, radius)
+        fov_cache.put(key, visible)
+    return visible
+
+
+
+def compute_map_fov(fov, x, y, radius):
+    # compute the FOV from (x, y) on a libtcod map and return it as a boolean
+    #   array. libtcod casts its rays with line functions that keep their
+    #   state in globals, so two FOVs must never be computed at once (the
+    #   VisibilityTable worker computes them too): every FOV goes through here
+    with fov_lock:
+        libtcod.map_compute_fov(fov, x, y, radius, FOV_LIGHT_WALLS, FOV_ALGO)
+        return libtcod.map_fov_array(fov)
+
+
+
+def render_all():
+    global fov_recompute, drawn_tiles, drawn_objects
+
+    # tiles whose look changed this frame. only these (and cells that objects
+    #   moved into or out of) are redrawn, everything else on con is left as
+    #   it was drawn in an earlier frame
+    redrawn = set()
+
+    if update_fov():
+        # the FOV was recomputed (e.g. the player moved). the tiles that
+        #   change are the ones that came into or went out of view, plus the
+        #   ones that were just explored
+        tiles = get_tile_looks()
+        if drawn_tiles is None:
+            changed = None
+        else:
+            (changed_x, changed_y) = numpy.nonzero(tiles != drawn_tiles)
+            changed = list(zip(changed_x.tolist(), changed_y.tolist()))
+
+        if changed is None or len(changed) > MAX_DIRTY_TILES:
+            # too much changed (e.g. a new floor), push the whole map at once
+            flat = tiles.ravel(order = 'F')
+            libtcod.console_fill_char(con, tile_chars[flat])
+            (r, g, b) = tile_fore[:, flat]
+            libtcod.console_fill_foreground(con, r, g, b)
+            (r, g, b) = tile_back[:, flat]
+            libtcod.console_fill_background(con, r, g, b)
+            drawn_objects = {}
+        else:
+            for (x, y) in changed:
+                (char, fore, back) = tile_looks[tiles[x, y]]
+                libtcod.console_put_char_ex(con, x, y, char, fore, back)
+            redrawn.update(changed)
+        drawn_tiles = tiles
+
+    # find what each cell with a visible object should show. later objects
+    #   cover earlier ones, and the player is drawn last so it shows up over
+    #   corpses (and other items)
+    glyphs = {}
     for object in objects:
-        if object != player:
+        if object != player and object.is_visible():
+            glyphs[(object.x, object.y)] = object
+    if player.is_visible():
+        glyphs[(player.x, player.y)] = player
+
+    # erase objects that moved away or disappeared since the last frame
+    for pos in drawn_objects:
+        if pos not in glyphs and pos not in redrawn:
+            (x, y) = pos
+            (char, fore, back) = tile_looks[drawn_tiles[x, y]]
+            libtcod.console_put_char_ex(con, x, y, char, fore, back)
+
+    # and draw the ones that are new, changed or had their tile redrawn
+    new_drawn_objects = {}
+    for (pos, object) in glyphs.items():
+        glyph = (object.char, tuple(object.color))
+        if drawn_objects.get(pos) != glyph or pos in redrawn:
             object.draw()
-
-    # then draw player so it shows up over corpses (and other items)
-    player.draw()
+        new_drawn_objects[pos] = glyph
+    drawn_objects = new_drawn_objects
 
     # prepare to render GUI panel
     libtcod.console_set_default_background(panel, libtcod.black)
@@ -977,66 +2316,63 @@ def render_all():
 
 
 
-def create_room(room):
-    global map
-    # go through the tiles in the rectangle and make them passable
-    for x in range(room.x1 + 1, room.x2):
-        for y in range(room.y1 + 1, room.y2):
-            map[x][y].blocked = False
-            map[x][y].block_sight = False
+def create_room(floor_map, room):
+    # make the tiles inside the rectangle passable (its edges stay walls)
+    floor_map.dig(room.x1 + 1, room.y1 + 1, room.x2, room.y2)
+
 
 
+def create_h_tunnel(floor_map, x1, x2, y):
+    floor_map.dig(min(x1, x2), y, max(x1, x2) + 1, y + 1)
 
-def create_h_tunnel(x1, x2, y):
-    global map
-    for x in range(min(x1, x2), max(x1, x2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
 
 
+def create_v_tunnel(floor_map, y1, y2, x):
+    floor_map.dig(x, min(y1, y2), x + 1, max(y1, y2) + 1)
 
-def create_v_tunnel(y1, y2, x):
-    global map
-    for y in range(min(y1, y2), max(y1, y2) + 1):
-        map[x][y].blocked = False
-        map[x][y].block_sight = False
 
 
+def place_objects(floor, room, rng):
+    # place monsters and items in a room of a floor being generated, using
+    #   the floor's random generator
+    level = floor['level']
 
-def place_objects(room):
     # maximum number of monster per room
-    max_monsters = from_dungeon_level([[2, 1], [3, 4], [5, 6]])
+    max_monsters = from_dungeon_level([[2, 1], [3, 4], [5, 6]], level)
 
     # chance of each monster
     monster_chances = {}
     monster_chances['orc'] = 80 # orc always shows up, min 80% chance
     monster_chances['troll'] = from_dungeon_level([[15, 3], [30, 5],
-                                                   [60, 7]])
+                                                   [60, 7]], level)
     
     # maximum number of items per room
-    max_items = from_dungeon_level([[1, 1], [2, 4]])
+    max_items = from_dungeon_level([[1, 1], [2, 4]], level)
 
     # chance of each item
     item_chances = {}
     item_chances['heal'] = 35 # healing potion always shows up, min 35%
-    item_chances['lightning'] = from_dungeon_level([[25, 4]])
-    item_chances['fireball'] = from_dungeon_level([[25, 6]])
-    item_chances['confuse'] = from_dungeon_level([[10, 2]])
-    item_chances['sword'] = from_dungeon_level([[5, 4]])
-    item_chances['shield'] = from_dungeon_level([[15, 8]])
+    item_chances['lightning'] = from_dungeon_level([[25, 4]], level)
+    item_chances['fireball'] = from_dungeon_level([[25, 6]], level)
+    item_chances['confuse'] = from_dungeon_level([[10, 2]], level)
+    item_chances['sword'] = from_dungeon_level([[5, 4]], level)
+    item_chances['shield'] = from_dungeon_level([[15, 8]], level)
+
+    # chance of the room having a brazier
+    brazier_chance = from_dungeon_level([[30, 1], [20, 4], [10, 8]], level)
 
     
     # choose random number of monsters
-    num_monsters = libtcod.random_get_int(0, 0, max_monsters)
+    num_monsters = libtcod.random_get_int(rng, 0, max_monsters)
 
     for i in range(num_monsters):
         # choose random spot for each monster
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        x = libtcod.random_get_int(rng, room.x1 + 1, room.x2 - 1)
+        y = libtcod.random_get_int(rng, room.y1 + 1, room.y2 - 1)
 
 
-        if not is_blocked(x, y):
-            choice = random_choice(monster_chances)
+        if not is_blocked(x, y, floor['map'], floor['index']):
+            choice = random_choice(monster_chances, rng)
             if choice == 'orc':
                 # 80% chance of creating an orc
                 fighter_component = Fighter(hp = 20,
@@ -1063,19 +2399,19 @@ def place_objects(room):
                                  fighter = fighter_component,
                                  ai = ai_component)
 
-            objects.append(monster)
+            place_object(floor, monster)
 
     # choose random number of items
-    num_items = libtcod.random_get_int(0, 0, max_items)
+    num_items = libtcod.random_get_int(rng, 0, max_items)
 
     for i in range(num_items):
         # choose random spot for this item
-        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
-        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        x = libtcod.random_get_int(rng, room.x1 + 1, room.x2 - 1)
+        y = libtcod.random_get_int(rng, room.y1 + 1, room.y2 - 1)
 
         # only place it if tile is not blocked
-        if not is_blocked(x, y):
-            choice = random_choice(item_chances)
+        if not is_blocked(x, y, floor['map'], floor['index']):
+            choice = random_choice(item_chances, rng)
             if choice == 'heal':
                 # 70% chance of creating a healing potion
                 item_component = Item(use_function = cast_heal)
@@ -1112,25 +2448,67 @@ def place_objects(room):
                               libtcod.light_yellow, 
                               item = item_component, always_visible = True)
             
-            objects.append(item)
-            item.send_to_back() # items appear below other objects
-
+            # items appear below other objects
+            place_object(floor, item, to_back = True)
+
+    # some rooms are lit by a brazier in one of their corners, out of the way
+    #   of the tunnels (which run through the rooms' centers)
+    if libtcod.random_get_int(rng, 1, 100) <= brazier_chance:
+        x = room.x1 + 1 + libtcod.random_get_int(rng, 0, 1) * (room.x2 -
+                                                               room.x1 - 2)
+        y = room.y1 + 1 + libtcod.random_get_int(rng, 0, 1) * (room.y2 -
+                                                               room.y1 - 2)
+        if not is_blocked(x, y, floor['map'], floor['index']):
+            brazier = Object(x, y, '&', 'brazier', libtcod.flame,
+                             blocks = True, always_visible = True,
+                             light = Light(BRAZIER_RADIUS, BRAZIER_INTENSITY))
+            place_object(floor, brazier)
+
+
+
+def is_blocked(x, y, floor_map = None, index = None):
+    # test a tile of the current floor, or of the given map and object index
+    #   (for floors being generated)
+    if floor_map is None:
+        floor_map = map
+        index = object_index
 
-
-def is_blocked(x, y):
     # first test if map tile is blocked
-    if map[x][y].blocked:
+    if floor_map.blocked[x, y]:
         return True
 
     # then check for any blocking objects
-    for object in objects:
-        if object.x == x and object.y == y and object.blocks:
+    for object in index.at(x, y):
+        if object.blocks:
             return True
 
     return False
 
 
 
+def add_object(obj):
+    # put an object on the current floor
+    objects.append(obj)
+    object_index.add(obj)
+
+
+
+def remove_object(obj):
+    # take an object off the current floor
+    objects.remove(obj)
+    object_index.remove(obj)
+
+
+
+def index_objects():
+    global object_index
+    # (re)build the spatial index of the objects on the current floor
+    object_index = SpatialIndex()
+    for obj in objects:
+        object_index.add(obj)
+
+
+
 def player_move_or_attack(dx, dy):
     global fov_recompute
 
@@ -1140,8 +2518,8 @@ def player_move_or_attack(dx, dy):
 
     # try to find an attackable object there
     target = None
-    for object in objects:
-        if object.x == x and object.y == y and object.fighter:
+    for object in object_index.at(x, y):
+        if object.fighter:
             target = object
             break
 
@@ -1149,7 +2527,7 @@ def player_move_or_attack(dx, dy):
     if target is not None:
         player.fighter.attack(target)
         return PLAYER_ATTACK_DELAY
-    elif map[x][y].blocked:
+    elif map.blocked[x, y]:
         return 0
     else:
         player.move(dx, dy)
@@ -1202,7 +2580,7 @@ def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
 
     # finally, some centered text with stat values
     libtcod.console_set_default_foreground(panel, libtcod.white)
-    libtcod.console_print_ex(panel, x + total_width / 2, y, libtcod.BKGND_NONE,
+    libtcod.console_print_ex(panel, x + total_width // 2, y, libtcod.BKGND_NONE,
         libtcod.CENTER, name + ': ' + str(value) + '/' + str(maximum))
 
     # print the game messages, one at a time
@@ -1236,9 +2614,8 @@ def get_names_under_mouse():
     # get mouse's current coordinates
     (x, y) = (mouse.cx, mouse.cy)
     # create a list with the names of all objects in player's FOV at (x,y)
-    names = [obj.name for obj in objects
-        if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map,
-                                                               obj.x, obj.y)]
+    names = [obj.name for obj in object_index.at(x, y)
+        if visible_tiles[obj.x, obj.y]]
 
     # join the names into a string and return them with first letter capitalized
     names = ', '.join(names)
@@ -1246,14 +2623,66 @@ def get_names_under_mouse():
 
 
 
+def get_tile_looks():
+    # return an array, indexed [x, y], of how every tile should look (one of
+    #   the TILE_* constants). walls and floors start out as remembered
+    #   (dark), become lit if the torch lights them, take the shade of their
+    #   light level if only other lights do, and unexplored tiles stay black
+    tiles = numpy.where(map.block_sight, TILE_DARK_WALL, TILE_DARK_FLOOR)
+    dim = visible_tiles & ~torch_tiles
+    if dim.any():
+        shade = light_map.levels[dim] * LIGHT_STEPS // LIGHT_FULL
+        tiles[dim] = numpy.where(shade >= LIGHT_STEPS,
+            tiles[dim] + TILE_LIGHT_WALL - TILE_DARK_WALL,
+            TILE_DIM_WALL + 2 * numpy.minimum(shade, LIGHT_STEPS - 1) +
+            tiles[dim] - TILE_DARK_WALL)
+    tiles[torch_tiles] += TILE_LIGHT_WALL - TILE_DARK_WALL
+    tiles[~map.explored] = TILE_UNEXPLORED
+    return numpy.asfortranarray(tiles)
+
+
+
+def pack_fov(visible, x, y, radius):
+    # pack the part of a FOV from (x, y) that radius reaches (all of it for a
+    #   radius of 0) into bits. returns the square that part covers, as
+    #   (x1, y1, x2, y2), and the bits
+    if radius > 0:
+        square = (max(x - radius, 0), max(y - radius, 0),
+                  min(x + radius + 1, MAP_WIDTH),
+                  min(y + radius + 1, MAP_HEIGHT))
+    else:
+        square = (0, 0, MAP_WIDTH, MAP_HEIGHT)
+    (x1, y1, x2, y2) = square
+    return (square, numpy.packbits(visible[x1:x2, y1:y2].ravel(order = 'F')))
+
+
+
+def unpack_fov(mask):
+    # return a FOV packed by pack_fov as a boolean array, indexed [x, y]
+    ((x1, y1, x2, y2), bits) = mask
+    visible = numpy.zeros((MAP_WIDTH, MAP_HEIGHT), dtype = bool, order = 'F')
+    size = (x2 - x1) * (y2 - y1)
+    visible[x1:x2, y1:y2] = numpy.unpackbits(bits)[:size].reshape(
+        (x2 - x1, y2 - y1), order = 'F')
+    return visible
+
+
+
+def in_fov(x, y):
+    # whether the player can see a tile, which may be off the map
+    return (0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT and
+            bool(visible_tiles[x, y]))
+
+
+
 def closest_monster(max_range):
     # find closest enemy, up to a maximum range, and in the player's FOV
     closest_enemy = None
     closest_dist = max_range + 1 # start slightly outside of max range
 
-    for object in objects:
+    for object in object_index.in_radius(player.x, player.y, max_range):
         if (object.fighter and not object == player and 
-            libtcod.map_is_in_fov(fov_map, object.x, object.y)):
+            visible_tiles[object.x, object.y]):
             # calculate distance between object and player
             dist = player.distance_to(object)
             if dist < closest_dist:
@@ -1271,6 +2700,11 @@ def menu(header, options, width):
     if len(options) > 26: raise ValueError('Cannot have a menu with more than' +
                                            '26 options.')
 
+    # the choice may have been made already, in a journal being replayed
+    replayed = replay_input(b'M')
+    if replayed is not None:
+        return option_index(replayed[0], options)
+
     # calculate total height for the header (after auto-wrap) and one line per
     #   option
     if header == '':
@@ -1299,8 +2733,8 @@ def menu(header, options, width):
         letter_index += 1
 
     # blit the contents of "window" to the root console
-    x = SCREEN_WIDTH/2 - width/2
-    y = SCREEN_HEIGHT/2 - height/2
+    x = SCREEN_WIDTH//2 - width//2
+    y = SCREEN_HEIGHT//2 - height//2
     libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
 
     # present the root console (i.e. the menu) and wait for a keypress
@@ -1311,9 +2745,15 @@ def menu(header, options, width):
         # Alt+Enter: toggle fullscreen
         libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
 
+    record_input(b'M', key.c)
+    return option_index(key.c, options)
+
+
+
+def option_index(c, options):
     # convert the ASCII code to an index; if it corresponds to an option,
     #   return it
-    index = key.c - ord('a')
+    index = c - ord('a')
     if index >= 0 and index < len(options):
         return index
     return None
@@ -1371,6 +2811,7 @@ def cast_lightning():
             ' with a loud thunder! ' +
             'The damage is ' + str(LIGHTNING_DAMAGE) + ' hit points.',
             libtcod.light_blue)
+    make_noise(monster.x, monster.y)
     monster.fighter.take_damage(LIGHTNING_DAMAGE)
 
 
@@ -1383,7 +2824,9 @@ def cast_confuse():
     if monster is None:
         return 'cancelled' 
 
-    # temporarily replace the monster's AI with a confused one
+    # temporarily replace the monster's AI with a confused one (waking it up
+    #   first, so it gets scheduled)
+    wake_monster(monster)
     old_ai = monster.ai
     monster.ai = ConfusedMonster(old_ai)
     monster.ai.owner = monster # tell the new AI component who owns it
@@ -1402,10 +2845,11 @@ def cast_fireball():
         return 'cancelled'
     message('The fireball explodes, burning everything within ' + 
             str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
+    make_noise(x, y)
 
-    for obj in objects:
+    for obj in object_index.in_radius(x, y, FIREBALL_RADIUS):
         # damage every fighter in range, including the player
-        if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
+        if obj.fighter:
             message('The ' + obj.name + ' gets burned for ' + 
                     str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
             obj.fighter.take_damage(FIREBALL_DAMAGE)
@@ -1415,6 +2859,14 @@ def cast_fireball():
 def target_tile(max_range = None):
     # return the position of a tile left-clicked in player's FOV
     global key, mouse
+
+    # the tile may have been picked already, in a journal being replayed
+    replayed = replay_input(b'T')
+    if replayed is not None:
+        if replayed[0] < 0:
+            return (None, None)
+        return replayed
+
     while True:
         # render the screen. this erases the inventory and shows the names of
         #   objects under the mouse
@@ -1428,11 +2880,13 @@ def target_tile(max_range = None):
 
         (x, y) = (mouse.cx, mouse.cy)
 
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+        if (mouse.lbutton_pressed and in_fov(x, y) and
             (max_range is None or player.distance(x, y) <= max_range)):
+            record_input(b'T', x, y)
             return (x, y)
         if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
             # cancel if the player right-clicks or presses ESC
+            record_input(b'T', -1, -1)
             return (None, None)
 
 
@@ -1447,8 +2901,8 @@ def target_monster(max_range = None):
             return None
 
         # return the first clicked monster, otherwise continue looping
-        for obj in objects:
-            if obj.x == x and obj.y == y and obj.fighter and obj != player:
+        for obj in object_index.at(x, y):
+            if obj.fighter and obj != player:
                 return obj
 
 
@@ -1488,9 +2942,18 @@ def check_level_up():
 
 
 
-def random_choice_index(chances):
+def seed_random(seed):
+    # reseed libtcod's default generator, which every random roll in the game
+    #   uses, so a game can be played again exactly (e.g. for benchmarks)
+    rng = libtcod.random_new_from_seed(seed)
+    libtcod.random_restore(0, rng)
+    libtcod.random_delete(rng)
+
+
+
+def random_choice_index(chances, rng = 0):
     # choose on option from list of chances, returning its index
-    dice = libtcod.random_get_int(0, 1, sum(chances))
+    dice = libtcod.random_get_int(rng, 1, sum(chances))
 
     # go through all chances, keeping the sum so far
     running_sum = 0
@@ -1504,20 +2967,23 @@ def random_choice_index(chances):
 
 
 
-def random_choice(chances_dict):
+def random_choice(chances_dict, rng = 0):
     # choose one option from dictionary of chances, returning its key
-    chances = chances_dict.values()
-    strings = chances_dict.keys()
+    chances = list(chances_dict.values())
+    strings = list(chances_dict.keys())
 
-    return strings[random_choice_index(chances)]
+    return strings[random_choice_index(chances, rng)]
 
 
 
-def from_dungeon_level(table):
-    # returns a value that depends on level. the table specifies what value
-    #  occurs after each level, default is 0.
+def from_dungeon_level(table, floor_level = None):
+    # returns a value that depends on level (the current dungeon level by
+    #  default). the table specifies what value occurs after each level,
+    #  default is 0.
+    if floor_level is None:
+        floor_level = dungeon_level
     for (value, level) in reversed(table):
-        if dungeon_level >= level:
+        if floor_level >= level:
             return value
     return 0
 
@@ -1553,25 +3019,57 @@ def get_all_equipped(obj):
 monster_chances = {'orc': 80, 'troll': 20}
 item_chances = {'heal': 70, 'lightning': 10, 'fireball': 10, 'confuse': 10}
 
-# Set font
-libtcod.console_set_custom_font('terminal12x12_gs_ro.png',
-                                libtcod.FONT_TYPE_GREYSCALE |
-                                libtcod.FONT_LAYOUT_ASCII_INROW)
+# the saved games, and what writes them in the background
+save_store = savefile.SaveStore(SAVE_FILE)
+save_worker = savefile.SaveWorker()
+
+# the journal input is logged to (see start_journal), and the input left to
+#   replay while a journal is being replayed
+journal = None
+replay_entries = None
+
+# the AI classes and the functions objects can refer to, for the save file
+ai_types = [BasicMonster, ConfusedMonster]
+save_functions = {}
+for function in [player_death, monster_death, cast_heal, cast_lightning,
+                 cast_confuse, cast_fireball]:
+    save_functions[function.__name__] = function
+
+# FOV map, created by the first call to initialize_fov, and the current
+#   floor's precomputed FOVs
+fov_map = None
+visibility = None
+# held while computing a FOV, see compute_map_fov
+fov_lock = threading.Lock()
+
+# chase map, created by initialize_pathing
+chase_map = None
+chase_root = None
+
+def initialize_screen():
+    global con, panel
 
-# initialize window
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'LovecraftRL', False)
+    # Set font
+    libtcod.console_set_custom_font('terminal12x12_gs_ro.png',
+                                    libtcod.FONT_TYPE_GREYSCALE |
+                                    libtcod.FONT_LAYOUT_ASCII_INROW)
 
-# set FPS to 20
-libtcod.sys_set_fps(LIMIT_FPS)
+    # initialize window
+    libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'LovecraftRL',
+                              False)
 
-# create off-screen console to draw on
-con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
+    # set FPS to 20
+    libtcod.sys_set_fps(LIMIT_FPS)
 
-# create GUI panel
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+    # create off-screen console to draw on
+    con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
 
-# start the game by loading the main menu
-main_menu()
+    # create GUI panel
+    panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
 
 
 
+if __name__ == '__main__':
+    # start the game by loading the main menu
+    initialize_screen()
+    main_menu()
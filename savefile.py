@@ -0,0 +1,524 @@
+#
+# compact binary save files for LovecraftRL
+#
+# a save file starts with a magic number and a format version, followed by a
+# list of chunks. every chunk has a four letter tag, a key (e.g. the number of
+# the floor it holds) and a payload.
+#
+# payloads are record sets: a table of strings, tables of fixed-size records
+# packed with struct, and raw byte blobs (e.g. map layers packed into
+# bitfields). records refer to strings and to each other by index, so nothing
+# in a save file is pickled.
+#
+# saved games are kept in a SaveStore, an sqlite database with one slot per
+# saved game. a slot's row holds what the game's menu shows about it, so
+# listing the slots doesn't unpack anything, and the game state and every
+# floor are payloads in tables of their own, so a save only has to rewrite
+# what changed. a save is a single transaction.
+#
+# SaveDirectory holds files made of chunks instead, for floors spilled from
+# memory and for journals.
+#
+# record sets are only packed into bytes as they are written. a game can be
+# snapshotted into RecordWriters on the main thread, then packed and written
+# to disk on a SaveWorker's thread.
+#
+# next to the save files, journals log what the player did since a save was
+# taken. a journal starts with a checkpoint (the turn of the save and the seed
+# the random number generator was reset to) followed by fixed-size entries,
+# and is only ever appended to, so a crash at worst cuts off its last entry.
+#
+
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+
+try:  # the queue module was renamed in python 3
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy
+
+MAGIC = b'LCRL'
+VERSION = 4
+JOURNAL_MAGIC = b'LCRJ'
+
+HEADER = struct.Struct('<4sH')
+CHUNK = struct.Struct('<4sII')
+COUNT = struct.Struct('<I')
+# turn, seed
+CHECKPOINT = struct.Struct('<iI')
+# kind, two values whose meaning depends on the kind
+ENTRY = struct.Struct('<cii')
+
+# tables of a SaveStore
+TABLES = ['slots', 'games', 'floors']
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS slots (slot INTEGER PRIMARY KEY, '
+    'dungeon_level INTEGER, turn REAL, player_level INTEGER, saved_at REAL)',
+    'CREATE TABLE IF NOT EXISTS games (slot INTEGER PRIMARY KEY, data BLOB)',
+    'CREATE TABLE IF NOT EXISTS floors (slot INTEGER, num INTEGER, '
+    'data BLOB, PRIMARY KEY (slot, num))']
+
+
+
+class SaveFormatError(ValueError):
+    # raised for files that aren't LovecraftRL saves, or are from another
+    #   version of the game
+    pass
+
+# what reading saved games can raise besides a missing slot (KeyError): a
+#   save from another version, a damaged or locked database, or a file that
+#   can't be read
+READ_ERRORS = (SaveFormatError, sqlite3.Error, EnvironmentError)
+
+
+
+class RecordWriter:
+    # collects strings, records and blobs and packs them into one payload.
+    #   formats is a list of (table name, struct format) pairs, in the order
+    #   the tables are stored in
+    def __init__(self, formats):
+        self.formats = [(name, struct.Struct(fmt)) for (name, fmt) in formats]
+        self.strings = []
+        self.string_ids = {}
+        self.records = dict((name, []) for (name, fmt) in formats)
+        self.blobs = []
+
+    def string(self, text):
+        # return the index of a string in the string table (-1 for None)
+        if text is None:
+            return -1
+        if text not in self.string_ids:
+            self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_ids[text]
+
+    def add(self, table, *values):
+        # append a record to a table and return its index
+        records = self.records[table]
+        records.append(values)
+        return len(records) - 1
+
+    def blob(self, data):
+        # append a blob of raw bytes
+        self.blobs.append(data)
+
+    def pack(self):
+        parts = [COUNT.pack(len(self.strings))]
+        for text in self.strings:
+            data = encode(text)
+            parts.append(COUNT.pack(len(data)))
+            parts.append(data)
+        for (name, fmt) in self.formats:
+            records = self.records[name]
+            parts.append(COUNT.pack(len(records)))
+            parts.extend(fmt.pack(*values) for values in records)
+        parts.append(COUNT.pack(len(self.blobs)))
+        for data in self.blobs:
+            parts.append(COUNT.pack(len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+
+
+class RecordReader:
+    # unpacks a payload written by RecordWriter with the same formats
+    def __init__(self, data, formats):
+        self.data = data
+        self.offset = 0
+
+        self.strings = [decode(self.read_bytes())
+                        for i in range(self.read_count())]
+
+        self.records = {}
+        for (name, fmt) in formats:
+            fmt = struct.Struct(fmt)
+            records = []
+            for i in range(self.read_count()):
+                records.append(fmt.unpack_from(data, self.offset))
+                self.offset += fmt.size
+            self.records[name] = records
+
+        self.blobs = [self.read_bytes() for i in range(self.read_count())]
+
+    def string(self, index):
+        if index < 0:
+            return None
+        return self.strings[index]
+
+    def read_count(self):
+        (count,) = COUNT.unpack_from(self.data, self.offset)
+        self.offset += COUNT.size
+        return count
+
+    def read_bytes(self):
+        size = self.read_count()
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+
+
+def encode(text):
+    # python 2 strings are bytes already
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8')
+
+def decode(data):
+    # keep strings as str on python 2 as well
+    if bytes is str:
+        return data
+    return data.decode('utf-8')
+
+
+
+def pack_bits(layer):
+    # pack a 2D boolean array into a bitfield, one bit per tile, compressed
+    #   (maps are mostly large areas of the same value)
+    return zlib.compress(numpy.packbits(layer.ravel(order = 'F')).tobytes())
+
+def unpack_bits(data, shape):
+    bits = numpy.unpackbits(numpy.frombuffer(zlib.decompress(data),
+                                             dtype = numpy.uint8))
+    size = shape[0] * shape[1]
+    return bits[:size].astype(bool).reshape(shape, order = 'F')
+
+
+
+def packed(payload):
+    # a payload can be bytes or a RecordWriter, which is packed here
+    if isinstance(payload, RecordWriter):
+        return payload.pack()
+    return payload
+
+
+
+def write_chunks(f, chunks):
+    # write a save file made of (tag, key, payload) chunks
+    f.write(HEADER.pack(MAGIC, VERSION))
+    for (tag, key, payload) in chunks:
+        payload = packed(payload)
+        f.write(CHUNK.pack(tag, key, len(payload)))
+        f.write(payload)
+
+def read_chunks(f):
+    # read the (tag, key, payload) chunks of a save file
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise SaveFormatError('not a save file')
+    (magic, version) = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise SaveFormatError('not a save file')
+    if version != VERSION:
+        raise SaveFormatError('save file version %d, expected %d' %
+                              (version, VERSION))
+
+    chunks = []
+    while True:
+        header = f.read(CHUNK.size)
+        if not header:
+            break
+        if len(header) < CHUNK.size:
+            raise SaveFormatError('truncated save file')
+        (tag, key, size) = CHUNK.unpack(header)
+        payload = f.read(size)
+        if len(payload) < size:
+            raise SaveFormatError('truncated save file')
+        chunks.append((tag, key, payload))
+    return chunks
+
+
+
+class SaveStore:
+    # the saved games, one per slot, in an sqlite database. every method
+    #   opens a connection of its own, so a store can be used from the game
+    #   and from a SaveWorker's thread
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self, replace_old = False):
+        # open the database, setting it up if it's new. a database from
+        #   another version of the game raises SaveFormatError, unless
+        #   replace_old is set: then its games are thrown away and it's set up
+        #   again
+        directory = os.path.dirname(self.path)
+        if directory:
+            SaveDirectory(directory).make()
+        connection = sqlite3.connect(self.path, timeout = 30)
+        (version,) = connection.execute('PRAGMA user_version').fetchone()
+        if version != 0 and version != VERSION:
+            if not replace_old:
+                connection.close()
+                raise SaveFormatError('saved games version %d, expected %d' %
+                                      (version, VERSION))
+            with connection:
+                for table in TABLES:
+                    connection.execute('DROP TABLE IF EXISTS ' + table)
+            version = 0
+        if version == 0:
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.execute('PRAGMA user_version = %d' % VERSION)
+        return connection
+
+    def slots(self):
+        # list the saved games as (slot, dungeon_level, turn, player_level,
+        #   saved_at) without reading any of them
+        if not os.path.exists(self.path):
+            return []
+        connection = self.connect()
+        try:
+            return connection.execute('SELECT slot, dungeon_level, turn, '
+                                      'player_level, saved_at FROM slots '
+                                      'ORDER BY slot').fetchall()
+        finally:
+            connection.close()
+
+    def write(self, slot, info, game, floors, num_floors):
+        # save a game to a slot, all at once or not at all. info is
+        #   (dungeon_level, turn, player_level, saved_at) for the slot's row,
+        #   game the game's payload and floors a list of (number, payload)
+        #   of the floors that changed. floors past num_floors, left over
+        #   from an older game in the slot, are removed. the games of another
+        #   version of the game can't be loaded (the menu shows their slots
+        #   as empty), so they're replaced too
+        connection = self.connect(replace_old = True)
+        try:
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO slots '
+                                   'VALUES (?, ?, ?, ?, ?)', (slot,) + info)
+                connection.execute('INSERT OR REPLACE INTO games '
+                                   'VALUES (?, ?)',
+                                   (slot, sqlite3.Binary(packed(game))))
+                connection.executemany('INSERT OR REPLACE INTO floors '
+                                       'VALUES (?, ?, ?)',
+                                       [(slot, num,
+                                         sqlite3.Binary(packed(payload)))
+                                        for (num, payload) in floors])
+                connection.execute('DELETE FROM floors '
+                                   'WHERE slot = ? AND num > ?',
+                                   (slot, num_floors))
+        finally:
+            connection.close()
+
+    def read_game(self, slot):
+        return self.read('SELECT data FROM games WHERE slot = ?', (slot,))
+
+    def read_floor(self, slot, num):
+        return self.read('SELECT data FROM floors WHERE slot = ? AND num = ?',
+                         (slot, num))
+
+    def read(self, query, values):
+        connection = self.connect()
+        try:
+            row = connection.execute(query, values).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            raise KeyError(values)
+        # blobs come back as buffers on python 2
+        return bytes(row[0])
+
+
+
+class SaveDirectory:
+    # a directory holding one save file per key
+    def __init__(self, path):
+        self.path = path
+
+    def filename(self, key):
+        return os.path.join(self.path, key + '.sav')
+
+    def exists(self, key):
+        return os.path.exists(self.filename(key))
+
+    def make(self):
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # another thread may have just made it
+                if not os.path.isdir(self.path):
+                    raise
+
+    def write(self, key, chunks):
+        # write to a temporary file first and make sure it's on disk, so a
+        #   crash halfway through never leaves a broken file behind
+        self.make()
+        filename = self.filename(key)
+        f = open(filename + '.tmp', 'wb')
+        try:
+            write_chunks(f, chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        replace(filename + '.tmp', filename)
+
+    def read(self, key):
+        f = open(self.filename(key), 'rb')
+        try:
+            return read_chunks(f)
+        finally:
+            f.close()
+
+    def journal_filename(self, serial):
+        return os.path.join(self.path, 'journal-%d.jnl' % serial)
+
+    def open_journal(self, serial, turn, seed):
+        # start a new journal, replacing any old one with the same serial
+        self.make()
+        return JournalWriter(self.journal_filename(serial), turn, seed)
+
+    def read_journals(self, serial):
+        # read the journal with the given serial and the ones that follow it,
+        #   for as long as there are any, as (turn, seed, entries). one that
+        #   can't be read (e.g. cut short by a crash) ends the list
+        journals = []
+        while os.path.exists(self.journal_filename(serial)):
+            f = open(self.journal_filename(serial), 'rb')
+            try:
+                journals.append(read_journal(f))
+            except SaveFormatError:
+                break
+            finally:
+                f.close()
+            serial += 1
+        return journals
+
+    def journal_serials(self):
+        # the serials of the journals in the directory
+        if not os.path.isdir(self.path):
+            return []
+        return [int(name[len('journal-'):-len('.jnl')])
+                for name in os.listdir(self.path)
+                if name.startswith('journal-') and name.endswith('.jnl')]
+
+    def last_journal(self):
+        # the highest serial of the journals in the directory, 0 if there
+        #   are none
+        return max(self.journal_serials() + [0])
+
+    def remove_journals(self, before = None):
+        # remove the journals with a serial lower than before (all of them
+        #   if before is None)
+        for serial in self.journal_serials():
+            if before is None or serial < before:
+                try:
+                    os.remove(self.journal_filename(serial))
+                except OSError:
+                    # already gone
+                    pass
+
+
+
+def replace(source, destination):
+    # rename a file over another one (os.replace is python 3 only)
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        os.rename(source, destination)
+
+
+
+class JournalWriter:
+    # appends entries to a journal. entries are kept in a buffer until flush
+    #   is called (once a turn), so logging costs one write per turn and no
+    #   waiting for the disk
+    def __init__(self, filename, turn, seed):
+        self.f = open(filename, 'wb')
+        self.buffer = [HEADER.pack(JOURNAL_MAGIC, VERSION),
+                       CHECKPOINT.pack(turn, seed)]
+        self.flush()
+
+    def append(self, kind, a = 0, b = 0):
+        self.buffer.append(ENTRY.pack(kind, a, b))
+
+    def flush(self):
+        if self.buffer:
+            self.f.write(b''.join(self.buffer))
+            self.f.flush()
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+
+def read_journal(f):
+    # read a journal written by JournalWriter, as (turn, seed, entries) with
+    #   entries a list of (kind, a, b). an entry cut off by a crash is dropped
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise SaveFormatError('not a journal')
+    (magic, version) = HEADER.unpack(header)
+    if magic != JOURNAL_MAGIC:
+        raise SaveFormatError('not a journal')
+    if version != VERSION:
+        raise SaveFormatError('journal version %d, expected %d' %
+                              (version, VERSION))
+    checkpoint = f.read(CHECKPOINT.size)
+    if len(checkpoint) < CHECKPOINT.size:
+        raise SaveFormatError('truncated journal')
+    (turn, seed) = CHECKPOINT.unpack(checkpoint)
+
+    data = f.read()
+    entries = [ENTRY.unpack_from(data, offset) for offset
+               in range(0, len(data) - ENTRY.size + 1, ENTRY.size)]
+    return (turn, seed, entries)
+
+
+
+class SaveWorker:
+    # runs save jobs one after the other, in the order they were submitted, on
+    #   a background thread. the thread is started by the first job
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.error = None
+
+    def submit(self, function, *args):
+        if self.thread is None:
+            self.thread = threading.Thread(target = self.run)
+            # don't keep the game running just to finish a save, the files
+            #   are replaced atomically anyway
+            self.thread.daemon = True
+            self.thread.start()
+        self.jobs.put((function, args))
+
+    def finish(self):
+        # block until every submitted job is done. an error a job raised is
+        #   kept for wait or take_error to report
+        self.jobs.join()
+
+    def wait(self):
+        # block until every submitted job is done, then raise the error of
+        #   any job that failed
+        self.finish()
+        error = self.take_error()
+        if error is not None:
+            raise error
+
+    def take_error(self):
+        # return (and forget) the last error a job raised, if any
+        error = self.error
+        self.error = None
+        return error
+
+    def run(self):
+        while True:
+            (function, args) = self.jobs.get()
+            try:
+                function(*args)
+            except Exception:
+                self.error = sys.exc_info()[1]
+            finally:
+                self.jobs.task_done()